@@ -0,0 +1,109 @@
+import time
+import numpy as np
+import torch
+from torch import nn
+from grid_processor import REVERSE, NUM_ACTIONS, to_absolute
+
+# Batched policy inference. Observations from many games are stacked into
+# one float32 tensor and run through the model in a single no_grad forward
+# pass on the CPU.
+#
+# Actions are relative to the head-centred view GridProcessor produces (see
+# FORWARD ... TURN_LEFT and to_absolute in grid_processor, which need no
+# torch). REVERSE is the move SnakeGame._opposite rules out, so it is masked
+# before picking an action.
+
+
+class SnakePolicy(nn.Module):
+    # small conv net over the two head-centred grids, one logit per action
+
+    def __init__(self, grid_size=25, channels=2, hidden=128):
+        super().__init__()
+        self.grid_size = grid_size
+        # body indices run up to grid_size ** 2; keep inputs near [-1, 1]
+        self.register_buffer("scale", torch.tensor([1.0 / (grid_size * grid_size), 1.0]).view(1, channels, 1, 1))
+        self.features = nn.Sequential(
+            nn.Conv2d(channels, 16, kernel_size=3, padding=1),
+            nn.ReLU(),
+            nn.Conv2d(16, 32, kernel_size=3, stride=2, padding=1),
+            nn.ReLU(),
+        )
+        reduced = (grid_size + 1) // 2
+        self.head = nn.Sequential(
+            nn.Flatten(),
+            nn.Linear(32 * reduced * reduced, hidden),
+            nn.ReLU(),
+            nn.Linear(hidden, NUM_ACTIONS),
+        )
+
+    def forward(self, x):
+        return self.head(self.features(x * self.scale))
+
+
+class BatchAgent:
+
+    def __init__(self, model=None, grid_size=25, device="cpu"):
+        self.grid_size = grid_size
+        self.device = torch.device(device)
+        self.model = (model if model is not None else SnakePolicy(grid_size)).to(self.device)
+        self.model.eval()
+        self._mask = torch.zeros(NUM_ACTIONS, device=self.device)
+        self._mask[REVERSE] = float("-inf")
+        # input buffer reused across calls, grown when a bigger batch arrives
+        self._buffer = np.empty((0, 2, grid_size, grid_size), dtype=np.float32)
+
+    def stack(self, observations):
+        # get_ai_input() dicts, or an already stacked (B, 2, grid, grid) array
+        # such as BatchSnakeEnv or RolloutRunner observations
+        batch = len(observations)
+        if self._buffer.shape[0] < batch:
+            self._buffer = np.empty((batch, 2, self.grid_size, self.grid_size), dtype=np.float32)
+        out = self._buffer[:batch]
+        if isinstance(observations, np.ndarray):
+            np.copyto(out, observations, casting="unsafe")
+        else:
+            for i, obs in enumerate(observations):
+                out[i, 0] = obs["snake_grid"]
+                out[i, 1] = obs["food_grid"]
+        return torch.from_numpy(out)
+
+    def logits(self, observations):
+        inputs = self.stack(observations).to(self.device)
+        with torch.no_grad():
+            return self.model(inputs) + self._mask
+
+    def act(self, observations, directions=None, greedy=True):
+        # relative actions, or Direction values when the games' current
+        # directions are given
+        logits = self.logits(observations)
+        if greedy:
+            actions = logits.argmax(dim=1)
+        else:
+            actions = torch.distributions.Categorical(logits=logits).sample()
+        actions = actions.cpu().numpy()
+        if directions is None:
+            return actions
+        return to_absolute(actions, directions)
+
+
+def benchmark_latency(batch_sizes=(1, 8, 32, 128, 512, 2048), repeats=50, grid_size=25):
+    agent = BatchAgent(grid_size=grid_size)
+    rng = np.random.default_rng(0)
+    results = []
+    for batch in batch_sizes:
+        observations = rng.integers(-1, 10, size=(batch, 2, grid_size, grid_size)).astype(np.int16)
+        directions = rng.integers(1, 5, size=batch)
+        agent.act(observations, directions)
+        began = time.perf_counter()
+        for _ in range(repeats):
+            agent.act(observations, directions)
+        per_call = (time.perf_counter() - began) / repeats
+        results.append({"batch": batch, "ms_per_call": per_call * 1e3, "us_per_decision": per_call / batch * 1e6})
+    return results
+
+
+if __name__ == '__main__':
+    torch.set_num_threads(1)
+    print(f"{'batch':>6} {'ms/call':>10} {'us/decision':>12}")
+    for row in benchmark_latency():
+        print(f"{row['batch']:>6} {row['ms_per_call']:>10.3f} {row['us_per_decision']:>12.2f}")
@@ -0,0 +1,180 @@
+import numpy as np
+from snake_engine import Direction, BLOCK_SIZE, DELTAS
+from config import BoardConfig
+
+# N snake games stepped together in structure-of-arrays form. The rules are
+# the ones in SnakeEngine (wraparound board, moving onto the tail cell is
+# allowed, reversals are ignored); finished games are reset in place.
+#
+# Each game keeps a per-cell stamp grid: the value of the game's step counter
+# when the head last entered that cell. A cell is occupied while
+# t - stamp < length, so the body index that GridProcessor puts in its snake
+# grid is just t - stamp + 1 and the tail never has to be erased.
+
+EMPTY = -(2 ** 30)
+
+# indexed by Direction.value, 0 (keep the heading) never moves
+_DX, _DY = np.array([(0, 0)] + [DELTAS[Direction(value)] for value in range(1, 5)], dtype=np.int32).T
+_OPPOSITE = np.array([0, Direction.LEFT.value, Direction.RIGHT.value,
+                      Direction.DOWN.value, Direction.UP.value], dtype=np.int32)
+
+
+class BatchSnakeEnv:
+
+    def __init__(self, num_envs, w=500, h=500, block_size=BLOCK_SIZE, seed=None, obs_dtype=np.int16,
+                 view_radius=None, config=None, obs=None):
+        # obs: an existing (num_envs, 2, V, V) array to write observations
+        # into, e.g. a slice of shared memory, instead of a new one
+        if config is None:
+            config = BoardConfig(w, h, block_size, view_radius)
+        self.config = config
+        self.num_envs = num_envs
+        self.block_size = config.block_size
+        self.cols = config.cols
+        self.rows = config.rows
+        self.view_size = config.view_size
+        self.num_cells = self.cols * self.rows
+        self.capacity = self.num_cells + 1
+        self.rng = np.random.default_rng(seed)
+
+        n = num_envs
+        self._envs = np.arange(n)
+        self.head_x = np.zeros(n, dtype=np.int32)
+        self.head_y = np.zeros(n, dtype=np.int32)
+        self.direction = np.zeros(n, dtype=np.int32)
+        self.length = np.zeros(n, dtype=np.int32)
+        self.score = np.zeros(n, dtype=np.int32)
+        self.steps = np.zeros(n, dtype=np.int32)
+        self.food = np.zeros(n, dtype=np.int32)
+        self.t = np.zeros(n, dtype=np.int32)
+        self.stamp = np.full((n, self.num_cells), EMPTY, dtype=np.int32)
+        # ring buffer of body cells, the head sits at slot t % capacity
+        self.body = np.zeros((n, self.capacity), dtype=np.int32)
+        # score and length of the last finished episode of each env
+        self.final_score = np.zeros(n, dtype=np.int32)
+        self.final_steps = np.zeros(n, dtype=np.int32)
+
+        shape = (n, 2, self.view_size, self.view_size)
+        if obs is None:
+            obs = np.empty(shape, dtype=obs_dtype)
+        elif obs.shape != shape:
+            raise ValueError(f"obs must have shape {shape}, not {obs.shape}")
+        self.obs = obs
+        self.grid_processor = config.grid_processor()
+        self.reset()
+
+    def reset(self):
+        self._reset_envs(self._envs)
+        return self._observe()
+
+    def _reset_envs(self, envs):
+        if envs.size == 0:
+            return
+        start_x = (self.cols * self.block_size // 2) // self.block_size
+        start_y = (self.rows * self.block_size // 2) // self.block_size
+        self.stamp[envs] = EMPTY
+        self.direction[envs] = Direction.RIGHT.value
+        self.head_x[envs] = start_x
+        self.head_y[envs] = start_y
+        self.length[envs] = 3
+        self.score[envs] = 0
+        self.steps[envs] = 0
+        self.t[envs] = 3
+        for i in range(3):
+            cell = start_y * self.cols + (start_x - i) % self.cols
+            self.stamp[envs, cell] = 3 - i
+            self.body[envs, (3 - i) % self.capacity] = cell
+        self._place_food(envs)
+
+    def _body_index(self, envs, cells):
+        # 1 for the head up to length for the tail, anything else is free
+        return self.t[envs] - self.stamp[envs, cells] + 1
+
+    def _occupied(self, envs, cells):
+        idx = self._body_index(envs, cells)
+        return (idx >= 1) & (idx <= self.length[envs])
+
+    def _place_food(self, envs):
+        pending = envs
+        for _ in range(8):
+            if pending.size == 0:
+                return
+            cells = self.rng.integers(0, self.num_cells, size=pending.size, dtype=np.int32)
+            free = ~self._occupied(pending, cells)
+            self.food[pending[free]] = cells[free]
+            pending = pending[~free]
+
+        # crowded boards: draw straight from the free cells
+        for n in pending:
+            idx = self.t[n] - self.stamp[n] + 1
+            free_cells = np.flatnonzero((idx < 1) | (idx > self.length[n]))
+            self.food[n] = self.rng.choice(free_cells) if free_cells.size else -1
+
+    def step(self, actions, envs=None):
+        # actions are Direction values; 0 or a reversal keeps the heading.
+        # With envs only those games advance (actions lines up with envs)
+        # and the observations, rewards and dones returned are theirs.
+        actions = np.asarray(actions, dtype=np.int32)
+        subset = envs is not None
+        envs = np.asarray(envs, dtype=np.intp) if subset else self._envs
+        direction = self.direction[envs]
+        turn = (actions >= 1) & (actions <= 4) & (actions != _OPPOSITE[direction])
+        direction = np.where(turn, actions, direction).astype(np.int32)
+        head_x = (self.head_x[envs] + _DX[direction]) % self.cols
+        head_y = (self.head_y[envs] + _DY[direction]) % self.rows
+        cells = head_y * self.cols + head_x
+        self.direction[envs] = direction
+        self.head_x[envs] = head_x
+        self.head_y[envs] = head_y
+
+        idx = self._body_index(envs, cells)
+        length = self.length[envs]
+        collided = (idx >= 1) & (idx < length)
+        ate = (cells == self.food[envs]) & ~collided
+
+        t = self.t[envs] + 1
+        self.t[envs] = t
+        self.steps[envs] += 1
+        self.stamp[envs, cells] = t
+        self.body[envs, t % self.capacity] = cells
+        self.length[envs] = length + ate
+        self.score[envs] += ate
+
+        rewards = ate.astype(np.float32) - collided.astype(np.float32)
+        dones = collided.copy()
+
+        done_envs = envs[dones]
+        self.final_score[done_envs] = self.score[done_envs]
+        self.final_steps[done_envs] = self.steps[done_envs]
+        self._reset_envs(done_envs)
+        self._place_food(envs[ate])
+
+        if subset:
+            return self.observe(envs), rewards, dones
+        return self._observe(), rewards, dones
+
+    def snake_cells(self, n):
+        # (x, y) cells of env n from head to tail
+        slots = (self.t[n] - np.arange(self.length[n])) % self.capacity
+        cells = self.body[n, slots]
+        return np.stack([cells % self.cols, cells // self.cols], axis=1)
+
+    def observe(self, envs):
+        # observations of just these envs, in a new (len(envs), 2, V, V) array
+        envs = np.asarray(envs, dtype=np.intp)
+        world = self.t[envs, None] - self.stamp[envs] + 1
+        world[world > self.length[envs, None]] = -1
+        heads = self.head_y[envs] * self.cols + self.head_x[envs]
+        obs = np.empty((len(envs),) + self.obs.shape[1:], dtype=self.obs.dtype)
+        obs[:, 0] = self.grid_processor.snake_view_batch(world, heads, self.direction[envs])
+        obs[:, 1] = self.grid_processor.food_view_batch(heads, self.food[envs], self.direction[envs])
+        self.obs[envs] = obs
+        return obs
+
+    def _observe(self):
+        world = self.t[:, None] - self.stamp + 1
+        world[world > self.length[:, None]] = -1
+        heads = self.head_y * self.cols + self.head_x
+        self.obs[:, 0] = self.grid_processor.snake_view_batch(world, heads, self.direction)
+        self.obs[:, 1] = self.grid_processor.food_view_batch(heads, self.food, self.direction)
+        return self.obs
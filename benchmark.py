@@ -0,0 +1,416 @@
+import os
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import gc
+import sys
+import json
+import time
+import random
+import platform
+import subprocess
+import tracemalloc
+import numpy as np
+
+# Micro-benchmarks for the step, encode and render hot paths, runnable
+# headless. Every benchmark reports ns/op (mean and p50/p90/p99 over
+# samples of a few hundred microseconds each) and the memory one op
+# allocates according to tracemalloc: the peak while it runs and what it
+# leaves behind.
+#
+#   python benchmark.py                        run everything, print a table
+#   python benchmark.py -k encode --json a.json
+#   python benchmark.py --compare a.json b.json [--threshold 0.10]
+#
+# import/<module> times a bare import in fresh interpreters (startup not
+# included) and notes whether it pulled in pygame, which only rendering
+# should do.
+#
+# --compare exits with status 1 when any benchmark got slower than the
+# threshold, so it can gate a change. A run exits with status 1 too when an
+# import's p50 goes over its IMPORT_BUDGETS entry.
+
+BENCHMARKS = {}
+LENGTHS = (3, 10, 50, 150, 300, 600)
+IMPORTS = ("snake_engine", "grid_processor", "config", "game", "grid_view")
+# p50 ns allowed for modules that must stay cheap to import: game loads
+# numpy and pygame only when a SnakeGame is made
+IMPORT_BUDGETS = {"snake_engine": 60e6, "game": 60e6}
+
+
+def benchmark(name):
+    # registers a setup function that returns the operation to time
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+
+def _serpentine(length, grid_size=25, block_size=20):
+    # a legal snake of the given length laid out row by row, head last on
+    # the path, plus its direction and a free food cell
+    from snake_engine import Direction, Point
+    path = []
+    for y in range(grid_size):
+        xs = range(grid_size) if y % 2 == 0 else range(grid_size - 1, -1, -1)
+        path.extend((x, y) for x in xs)
+    body = path[:length][::-1]
+    (hx, hy), (nx, ny) = body[0], body[1]
+    direction = {(1, 0): Direction.RIGHT, (-1, 0): Direction.LEFT,
+                 (0, 1): Direction.DOWN, (0, -1): Direction.UP}[(hx - nx, hy - ny)]
+    food = path[length] if length < len(path) else None
+    snake = [Point(x * block_size, y * block_size) for x, y in body]
+    food = Point(food[0] * block_size, food[1] * block_size) if food else None
+    return snake, food, direction
+
+
+def _midgame_engine(steps=300, seed=0):
+    from snake_engine import SnakeEngine, Direction
+    engine = SnakeEngine(seed=seed)
+    rng = random.Random(seed)
+    for _ in range(steps):
+        action = rng.choice(list(Direction)) if rng.random() < 0.2 else None
+        if engine.step(action)[0]:
+            engine.reset()
+    return engine
+
+
+def _trajectory(frames=256, seed=0):
+    # (snake, food, direction) along a random game, for render benchmarks
+    engine = _midgame_engine(0, seed)
+    rng = random.Random(seed)
+    from snake_engine import Direction
+    states = []
+    while len(states) < frames:
+        action = rng.choice(list(Direction)) if rng.random() < 0.2 else None
+        if engine.step(action)[0]:
+            engine.reset()
+        states.append((list(engine.snake), engine.food, engine.direction))
+    return states
+
+
+@benchmark("engine/step")
+def _engine_step():
+    from snake_engine import Direction
+    engine = _midgame_engine()
+    rng = random.Random(1)
+    actions = [rng.choice(list(Direction)) if rng.random() < 0.2 else None for _ in range(4096)]
+    state = {"i": 0}
+
+    def op():
+        i = state["i"] = (state["i"] + 1) & 4095
+        if engine.step(actions[i])[0]:
+            engine.reset()
+    return op
+
+
+@benchmark("engine/_move")
+def _engine_move():
+    engine = _midgame_engine()
+    direction = engine.direction
+    return lambda: engine._move(direction)
+
+
+@benchmark("engine/_is_collision")
+def _engine_is_collision():
+    engine = _midgame_engine()
+    return engine._is_collision
+
+
+@benchmark("engine/_place_food")
+def _engine_place_food():
+    engine = _midgame_engine()
+    return engine._place_food
+
+
+def _encode_benchmark(module, length):
+    def setup():
+        snake, food, direction = _serpentine(length)
+        if module == "old":
+            import old_grid_processor
+            processor = old_grid_processor.GridProcessor()
+            direction = old_grid_processor.Direction[direction.name]
+        else:
+            from grid_processor import GridProcessor
+            processor = GridProcessor()
+        return lambda: processor.get_normalized_input(snake, food, direction)
+    return setup
+
+
+for _length in LENGTHS:
+    benchmark(f"encode/old/len={_length}")(_encode_benchmark("old", _length))
+    benchmark(f"encode/new/len={_length}")(_encode_benchmark("new", _length))
+
+
+@benchmark("encode/incremental")
+def _encode_incremental():
+    # what SnakeGame.get_ai_input pays per step
+    from grid_processor import GridProcessor, ObservationEncoder
+    engine = _midgame_engine()
+    engine.attach_encoder(ObservationEncoder(GridProcessor()))
+    return lambda: engine.encoder.encode(engine.food, engine.direction)
+
+
+@benchmark("encode/batch512")
+def _encode_batch():
+    from grid_processor import GridProcessor
+    states = _trajectory(512)
+    processor = GridProcessor()
+    args = processor.batch_arrays(states)
+    return lambda: processor.get_normalized_input_batch(*args)
+
+
+def _grid_view_frames():
+    from grid_processor import GridProcessor
+    processor = GridProcessor()
+    frames = []
+    for snake, food, direction in _trajectory(256):
+        obs = processor.get_normalized_input(snake, food, direction)
+        frames.append((obs["snake_grid"], obs["food_grid"]))
+    return frames
+
+
+@benchmark("render/grid_view.update")
+def _grid_view_update():
+    import pygame
+    from grid_view import GridView
+    pygame.init()
+    view = GridView()
+    frames = _grid_view_frames()
+    state = {"i": 0}
+
+    def op():
+        i = state["i"] = (state["i"] + 1) % len(frames)
+        view.update(*frames[i])
+    return op
+
+
+@benchmark("render/grid_view.update/unchanged")
+def _grid_view_unchanged():
+    import pygame
+    from grid_view import GridView
+    pygame.init()
+    view = GridView()
+    frame = _grid_view_frames()[0]
+    view.update(*frame)
+    return lambda: view.update(*frame)
+
+
+def _update_ui_benchmark(dirty_rects):
+    def setup():
+        import game
+        from snake_engine import Direction
+        snake_game = game.SnakeGame(dirty_rects=dirty_rects)
+        engine = snake_game.engine
+        rng = random.Random(2)
+        actions = [rng.choice(list(Direction)) if rng.random() < 0.2 else None for _ in range(4096)]
+        state = {"i": 0}
+
+        def op():
+            # one game frame: a step, then the redraw
+            i = state["i"] = (state["i"] + 1) & 4095
+            if engine.step(actions[i])[0]:
+                engine.reset()
+            snake_game._update_ui()
+        return op
+    return setup
+
+
+benchmark("render/_update_ui")(_update_ui_benchmark(False))
+benchmark("render/_update_ui/dirty_rects")(_update_ui_benchmark(True))
+
+
+def measure(op, samples=40, sample_time=0.0005):
+    # calibrate the ops per sample, then time samples with the GC off
+    op()
+    number = 1
+    while True:
+        began = time.perf_counter_ns()
+        for _ in range(number):
+            op()
+        elapsed = time.perf_counter_ns() - began
+        if elapsed >= sample_time * 1e9 or number >= 1 << 20:
+            break
+        number *= 2
+
+    per_op = np.empty(samples)
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for s in range(samples):
+            began = time.perf_counter_ns()
+            for _ in range(number):
+                op()
+            per_op[s] = (time.perf_counter_ns() - began) / number
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+    # allocations of single ops, on their own since tracing slows them down
+    allocation_ops = min(number, 64)
+    tracemalloc.start()
+    try:
+        peak = 0
+        start, _ = tracemalloc.get_traced_memory()
+        for _ in range(allocation_ops):
+            tracemalloc.reset_peak()
+            before, _ = tracemalloc.get_traced_memory()
+            op()
+            _, high = tracemalloc.get_traced_memory()
+            peak = max(peak, high - before)
+        end, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    p50, p90, p99 = np.percentile(per_op, [50, 90, 99])
+    return {
+        "ns_per_op": float(per_op.mean()),
+        "min": float(per_op.min()),
+        "p50": float(p50),
+        "p90": float(p90),
+        "p99": float(p99),
+        "ops": number * samples,
+        "alloc_peak_bytes": int(peak),
+        "alloc_net_bytes": (end - start) / allocation_ops,
+    }
+
+
+def measure_import(module, samples=10):
+    # each sample is a new interpreter, so the module and its dependencies
+    # are imported cold (apart from the OS file cache)
+    timing = ("import sys, time; began = time.perf_counter_ns(); import {0}; "
+              "print(time.perf_counter_ns() - began, 'pygame' in sys.modules)")
+    allocation = ("import tracemalloc; tracemalloc.start(); import {0}; "
+                  "print(*tracemalloc.get_traced_memory())")
+    here = os.path.dirname(os.path.abspath(__file__))
+
+    def child(code):
+        return subprocess.run([sys.executable, "-c", code.format(module)], capture_output=True, text=True,
+                              cwd=here, check=True).stdout.split()
+
+    per_op = np.empty(samples)
+    for s in range(samples):
+        elapsed, loads_pygame = child(timing)
+        per_op[s] = int(elapsed)
+    net, peak = child(allocation)
+
+    p50, p90, p99 = np.percentile(per_op, [50, 90, 99])
+    return {
+        "ns_per_op": float(per_op.mean()),
+        "min": float(per_op.min()),
+        "p50": float(p50),
+        "p90": float(p90),
+        "p99": float(p99),
+        "ops": samples,
+        "alloc_peak_bytes": int(peak),
+        "alloc_net_bytes": int(net),
+        "imports_pygame": loads_pygame == "True",
+    }
+
+
+def _environment():
+    import pygame
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "commit": commit,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pygame": pygame.version.ver,
+        "platform": platform.platform(),
+    }
+
+
+def run(pattern=None, samples=40, sample_time=0.0005):
+    results = {}
+    for name, setup in BENCHMARKS.items():
+        if pattern and pattern not in name:
+            continue
+        results[name] = measure(setup(), samples, sample_time)
+        print_row(name, results[name])
+    for module in IMPORTS:
+        name = f"import/{module}"
+        if pattern and pattern not in name:
+            continue
+        results[name] = measure_import(module, max(5, samples // 4))
+        if module in IMPORT_BUDGETS:
+            results[name]["budget"] = IMPORT_BUDGETS[module]
+        print_row(name, results[name])
+    return results
+
+
+def print_header():
+    print(f"{'benchmark':<36} {'ns/op':>12} {'p50':>12} {'p90':>12} {'p99':>12} {'peak alloc':>11}")
+
+
+def print_row(name, r):
+    print(f"{name:<36} {r['ns_per_op']:>12,.0f} {r['p50']:>12,.0f} {r['p90']:>12,.0f} {r['p99']:>12,.0f}"
+          f" {r['alloc_peak_bytes']:>11,}" + ("  (imports pygame)" if r.get("imports_pygame") else "")
+          + ("  OVER BUDGET" if over_budget(r) else ""))
+
+
+def over_budget(r):
+    return "budget" in r and r["p50"] > r["budget"]
+
+
+def compare(before, after, threshold=0.10):
+    # ratio of p50 times, which is steadier than the mean on a busy machine
+    regressions = []
+    print(f"{'benchmark':<36} {'before':>12} {'after':>12} {'change':>8}")
+    for name, old in before["results"].items():
+        new = after["results"].get(name)
+        if new is None:
+            continue
+        change = new["p50"] / old["p50"] - 1
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        elif change < -threshold:
+            flag = "  faster"
+        print(f"{name:<36} {old['p50']:>12,.0f} {new['p50']:>12,.0f} {change:>+8.1%}{flag}")
+    return regressions
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark the step, encode and render hot paths")
+    parser.add_argument("-k", dest="pattern", help="only run benchmarks whose name contains this")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--samples", type=int, default=40)
+    parser.add_argument("--sample-time", type=float, default=0.0005, help="seconds per sample")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"), help="compare two result files")
+    parser.add_argument("--threshold", type=float, default=0.10, help="slowdown that counts as a regression")
+    parser.add_argument("--list", action="store_true", help="list benchmark names")
+    args = parser.parse_args()
+    paths = [os.path.abspath(p) for p in (args.compare or [])]
+    json_path = os.path.abspath(args.json) if args.json else None
+    # game.py loads arial.ttf from the working directory
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+    if args.list:
+        print("\n".join(list(BENCHMARKS) + [f"import/{module}" for module in IMPORTS]))
+    elif args.compare:
+        with open(paths[0]) as f:
+            before = json.load(f)
+        with open(paths[1]) as f:
+            after = json.load(f)
+        regressions = compare(before, after, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s) over {args.threshold:.0%}")
+            sys.exit(1)
+    else:
+        print_header()
+        results = run(args.pattern, args.samples, args.sample_time)
+        if json_path:
+            with open(json_path, "w") as f:
+                json.dump({"environment": _environment(), "results": results}, f, indent=2)
+        over = [name for name, r in results.items() if over_budget(r)]
+        if over:
+            print(f"over budget: {', '.join(over)}")
+            sys.exit(1)
@@ -0,0 +1,52 @@
+from snake_engine import SnakeEngine, BLOCK_SIZE
+from grid_processor import GridProcessor
+
+# One description of the board that the engine, the observation encoding
+# and the grid view all take their geometry from, so a 100x100 board is
+# just BoardConfig.from_cells(100) everywhere.
+#
+# view_radius crops observations to the (2 * view_radius + 1)^2 cells
+# around the head instead of the whole board, so observation cost stays the
+# same however big the board gets. Only a square board fits in view whole;
+# other boards default to the largest crop that fits across their short
+# side, so the 600x500 window still gets the 25x25 grids it always had.
+
+
+class BoardConfig:
+
+    def __init__(self, w=500, h=500, block_size=BLOCK_SIZE, view_radius=None):
+        self.w = w
+        self.h = h
+        self.block_size = block_size
+        # same cell counts as SnakeEngine
+        self.cols = (w - block_size) // block_size + 1
+        self.rows = (h - block_size) // block_size + 1
+        if view_radius is None and self.cols != self.rows:
+            view_radius = (min(self.cols, self.rows) - 1) // 2
+        self.view_radius = view_radius
+
+    @classmethod
+    def from_cells(cls, cols, rows=None, block_size=BLOCK_SIZE, view_radius=None):
+        rows = cols if rows is None else rows
+        return cls(cols * block_size, rows * block_size, block_size, view_radius)
+
+    @property
+    def view_size(self):
+        # side of the observation grids
+        if self.view_radius is None:
+            return self.cols
+        return 2 * self.view_radius + 1
+
+    def engine(self, seed=None):
+        return SnakeEngine(self.w, self.h, self.block_size, seed=seed)
+
+    def grid_processor(self, **kwargs):
+        return GridProcessor(self.cols, self.block_size, view_radius=self.view_radius, rows=self.rows, **kwargs)
+
+    def grid_view(self, width=250):
+        from grid_view import GridView
+        return GridView(width, width, grid_size=self.view_size, block_size=self.block_size)
+
+    def __repr__(self):
+        crop = "" if self.view_radius is None else f", view_radius={self.view_radius}"
+        return f"BoardConfig({self.cols}x{self.rows} cells of {self.block_size}px{crop})"
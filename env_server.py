@@ -0,0 +1,274 @@
+import os
+import time
+import struct
+import asyncio
+import numpy as np
+from batch_env import BatchSnakeEnv
+from config import BoardConfig
+
+# Snake games served over a socket, for agents in other processes or on
+# other hosts. Every connection owns one game, a slot of a BatchSnakeEnv
+# that lives in the server. Requests are two bytes (opcode, action) and
+# every request gets one reply: a fixed header followed by the game's
+# (2, V, V) int16 observation, little-endian.
+#
+#   python env_server.py --listen unix:/tmp/snake.sock
+#   client = await SnakeClient.connect("unix:/tmp/snake.sock")
+#   obs, reward, done, score = await client.step(Direction.UP.value)
+#
+# The server collects the requests that arrive while it is busy and answers
+# them together once per tick: all pending steps go through one vectorized
+# BatchSnakeEnv.step over just those slots, so a thousand clients cost
+# about one batched step per tick rather than a thousand single ones.
+# Actions are Direction values (0 keeps the heading), as in BatchSnakeEnv.
+# Finished games are reset straight away; the reply that reports done
+# carries the final score and length and the observation of the new game.
+
+MAGIC = b"SNK1"
+RESET = 1
+STEP = 2
+OBSERVE = 3
+
+# server -> client on connect: magic, view size, slot
+HELLO = struct.Struct("<4sHH")
+# client -> server: opcode, action
+REQUEST = struct.Struct("<BB")
+# server -> client: opcode, done, reward, score, steps
+REPLY = struct.Struct("<BBfii")
+
+
+def _parse_address(address):
+    # "unix:/path" or "host:port"
+    if address.startswith("unix:"):
+        return "unix", address[5:]
+    host, _, port = address.rpartition(":")
+    return "tcp", (host or "127.0.0.1", int(port))
+
+
+class EnvServer:
+
+    def __init__(self, max_clients=1024, config=None, seed=None, tick_interval=0.0):
+        # tick_interval > 0 holds each tick open that long to gather more
+        # requests; 0 answers whatever arrived since the last tick
+        self.config = config if config is not None else BoardConfig()
+        self.max_clients = max_clients
+        self.tick_interval = tick_interval
+        self.env = BatchSnakeEnv(max_clients, seed=seed, config=self.config)
+        self.view_size = self.env.view_size
+        self.obs_bytes = 2 * self.view_size * self.view_size * 2
+
+        self._free = list(range(max_clients - 1, -1, -1))
+        self._writers = {}
+        self._pending = []
+        self._wakeup = asyncio.Event()
+        self._server = None
+        self._ticker = None
+        self.ticks = 0
+        self.requests = 0
+
+    async def start(self, address):
+        kind, where = _parse_address(address)
+        if kind == "unix":
+            if os.path.exists(where):
+                os.unlink(where)
+            self._server = await asyncio.start_unix_server(self._serve, where, backlog=4096)
+        else:
+            self._server = await asyncio.start_server(self._serve, *where, backlog=4096)
+        self._ticker = asyncio.ensure_future(self._tick_loop())
+        return self
+
+    async def serve_forever(self):
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self):
+        self._server.close()
+        # dropping the connections ends their handlers at the next read
+        for writer in list(self._writers.values()):
+            writer.close()
+        await self._server.wait_closed()
+        await asyncio.sleep(0)
+        self._ticker.cancel()
+
+    async def _serve(self, reader, writer):
+        if not self._free:
+            writer.close()
+            return
+        slot = self._free.pop()
+        self.env._reset_envs(np.array([slot]))
+        self._writers[slot] = writer
+        writer.write(HELLO.pack(MAGIC, self.view_size, slot))
+        try:
+            while True:
+                opcode, action = REQUEST.unpack(await reader.readexactly(REQUEST.size))
+                done = asyncio.get_running_loop().create_future()
+                self._pending.append((slot, opcode, action, done))
+                self._wakeup.set()
+                # one request at a time per game, so a slot is never stepped
+                # twice in a tick
+                await done
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            del self._writers[slot]
+            self._free.append(slot)
+            writer.close()
+
+    async def _tick_loop(self):
+        while True:
+            await self._wakeup.wait()
+            if self.tick_interval:
+                await asyncio.sleep(self.tick_interval)
+            self._wakeup.clear()
+            pending, self._pending = self._pending, []
+            self._tick(pending)
+
+    def _tick(self, pending):
+        env = self.env
+        slots = np.fromiter((p[0] for p in pending), dtype=np.intp, count=len(pending))
+        opcodes = np.fromiter((p[1] for p in pending), dtype=np.uint8, count=len(pending))
+        actions = np.fromiter((p[2] for p in pending), dtype=np.int32, count=len(pending))
+
+        resets = slots[opcodes == RESET]
+        env._reset_envs(resets)
+        stepping = opcodes == STEP
+        stepped = slots[stepping]
+        rewards = np.zeros(len(pending), dtype=np.float32)
+        dones = np.zeros(len(pending), dtype=np.bool_)
+        if stepped.size:
+            _, rewards[stepping], dones[stepping] = env.step(actions[stepping], stepped)
+        # stepped slots were observed by step(); the rest still need it
+        observed = slots[~stepping]
+        if observed.size:
+            env.observe(observed)
+
+        scores = np.where(dones, env.final_score[slots], env.score[slots]).tolist()
+        steps = np.where(dones, env.final_steps[slots], env.steps[slots]).tolist()
+        obs = env.obs[slots].astype("<i2", copy=False)
+        replies = zip(pending, dones.tolist(), rewards.tolist(), scores, steps, obs)
+        for (slot, opcode, _, done), game_over, reward, score, length, view in replies:
+            writer = self._writers.get(slot)
+            if writer is not None:
+                writer.write(REPLY.pack(opcode, game_over, reward, score, length) + view.tobytes())
+            done.set_result(None)
+        self.ticks += 1
+        self.requests += len(pending)
+
+
+class SnakeClient:
+
+    def __init__(self, reader, writer, view_size, slot):
+        self.reader = reader
+        self.writer = writer
+        self.view_size = view_size
+        self.slot = slot
+        self._size = REPLY.size + 2 * view_size * view_size * 2
+
+    @classmethod
+    async def connect(cls, address):
+        kind, where = _parse_address(address)
+        if kind == "unix":
+            reader, writer = await asyncio.open_unix_connection(where)
+        else:
+            reader, writer = await asyncio.open_connection(*where)
+        try:
+            magic, view_size, slot = HELLO.unpack(await reader.readexactly(HELLO.size))
+        except asyncio.IncompleteReadError:
+            writer.close()
+            raise ConnectionError("server is full") from None
+        if magic != MAGIC:
+            writer.close()
+            raise ConnectionError(f"not a snake env server: {magic!r}")
+        return cls(reader, writer, view_size, slot)
+
+    async def _request(self, opcode, action=0):
+        self.writer.write(REQUEST.pack(opcode, action))
+        data = await self.reader.readexactly(self._size)
+        _, done, reward, score, _ = REPLY.unpack_from(data)
+        obs = np.frombuffer(data, dtype="<i2", offset=REPLY.size).reshape(2, self.view_size, self.view_size)
+        return obs, reward, bool(done), score
+
+    async def reset(self):
+        return (await self._request(RESET))[0]
+
+    async def step(self, action):
+        # (obs, reward, done, score); score is the final one when done
+        return await self._request(STEP, action)
+
+    async def observe(self):
+        return (await self._request(OBSERVE))[0]
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+
+
+def _run_server(address, max_clients, seed, ready):
+    async def main():
+        server = await EnvServer(max_clients, seed=seed).start(address)
+        ready.set()
+        await server.serve_forever()
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
+
+
+async def _benchmark(address, clients, steps, seed):
+    rng = np.random.default_rng(seed)
+    connected = await asyncio.gather(*(SnakeClient.connect(address) for _ in range(clients)))
+    latencies = np.empty((clients, steps))
+
+    async def play(c, client):
+        await client.reset()
+        actions = rng.integers(0, 5, size=steps)
+        for s in range(steps):
+            began = time.perf_counter()
+            await client.step(int(actions[s]))
+            latencies[c, s] = time.perf_counter() - began
+
+    began = time.perf_counter()
+    await asyncio.gather(*(play(c, client) for c, client in enumerate(connected)))
+    elapsed = time.perf_counter() - began
+    await asyncio.gather(*(client.close() for client in connected))
+    return latencies, elapsed
+
+
+if __name__ == '__main__':
+    import argparse
+    import tempfile
+    import multiprocessing as mp
+
+    parser = argparse.ArgumentParser(description="Serve snake games over a socket, or benchmark the server")
+    parser.add_argument("--listen", default="unix:" + os.path.join(tempfile.gettempdir(), "snake_env.sock"),
+                        help="unix:/path or host:port")
+    parser.add_argument("--max-clients", type=int, default=1024)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--benchmark", action="store_true",
+                        help="start a server in a child process and drive it with loopback clients")
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--steps", type=int, default=200, help="steps per benchmark client")
+    args = parser.parse_args()
+
+    if not args.benchmark:
+        async def main():
+            server = await EnvServer(args.max_clients, seed=args.seed).start(args.listen)
+            print(f"serving {args.max_clients} games on {args.listen}")
+            await server.serve_forever()
+        asyncio.run(main())
+    else:
+        ready = mp.Event()
+        server = mp.Process(target=_run_server, args=(args.listen, max(args.max_clients, args.clients),
+                                                      args.seed, ready), daemon=True)
+        server.start()
+        ready.wait()
+        try:
+            latencies, elapsed = asyncio.run(_benchmark(args.listen, args.clients, args.steps, args.seed))
+        finally:
+            server.terminate()
+            server.join()
+        total = latencies.size
+        p50, p90, p99 = np.percentile(latencies, [50, 90, 99]) * 1e3
+        print(f"{args.clients} clients x {args.steps} steps over {args.listen}")
+        print(f"{total / elapsed:,.0f} steps/s, latency p50 {p50:.2f} ms  p90 {p90:.2f} ms  p99 {p99:.2f} ms")
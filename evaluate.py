@@ -0,0 +1,210 @@
+import os
+import sys
+import json
+import time
+import random
+import multiprocessing as mp
+import numpy as np
+from snake_engine import SnakeEngine, Direction
+
+# Tournament evaluation: plays many seeded games per policy across a process
+# pool and reports the score distribution, episode lengths, speed and how
+# games ended.
+#
+#   python evaluate.py --policy random planner --games 100000 --out report.json
+#
+# Game g of every policy uses seed --seed + g, so policies meet the same
+# food sequences as long as they play the same moves. Workers play chunks of
+# games and send back a Summary of each chunk rather than the episodes, so
+# memory stays flat however many games are played.
+#
+# Games end in one of:
+#   collision  the head hit the body (SnakeEngine._is_collision)
+#   timeout    too long without eating (--starve steps per body cell) or
+#              --max-steps in total
+#   won        the body fills the board, nowhere is left for food
+
+
+def _random_policy(seed, cols=25, rows=25):
+    rng = random.Random(seed)
+    directions = list(Direction)
+    return lambda engine: rng.choice(directions) if rng.random() < 0.2 else None
+
+
+def _planner_policy(seed, cols=25, rows=25):
+    from planner import Planner
+    planner = Planner(cols, rows)
+    return planner.engine_action
+
+
+# name -> factory(seed, cols, rows) returning policy(engine) -> Direction or
+# None, for engines of a cols x rows board
+POLICIES = {
+    "random": _random_policy,
+    "planner": _planner_policy,
+}
+CAUSES = ("collision", "timeout", "won")
+
+
+class Summary:
+    # running statistics of finished games: Welford mean/variance for score
+    # and length, a score histogram, and end causes; mergeable, so chunks
+    # summarised in workers combine into the same result
+
+    def __init__(self, max_score=625):
+        self.games = 0
+        self.steps = 0
+        self.seconds = 0.0
+        self.causes = dict.fromkeys(CAUSES, 0)
+        self.score_hist = np.zeros(max_score + 1, dtype=np.int64)
+        self._moments = {"score": [0.0, 0.0], "length": [0.0, 0.0]}
+        self._range = {"score": [None, None], "length": [None, None]}
+
+    def add(self, score, length, cause):
+        self.games += 1
+        self.steps += length
+        self.causes[cause] += 1
+        self.score_hist[min(score, len(self.score_hist) - 1)] += 1
+        for key, value in (("score", score), ("length", length)):
+            moments = self._moments[key]
+            delta = value - moments[0]
+            moments[0] += delta / self.games
+            moments[1] += delta * (value - moments[0])
+            low, high = self._range[key]
+            self._range[key] = [value if low is None else min(low, value),
+                                value if high is None else max(high, value)]
+
+    def merge(self, other):
+        if other.games == 0:
+            return self
+        total = self.games + other.games
+        for key, (mean, m2) in other._moments.items():
+            mine = self._moments[key]
+            delta = mean - mine[0]
+            mine[1] += m2 + delta * delta * self.games * other.games / total
+            mine[0] += delta * other.games / total
+            low, high = self._range[key]
+            olow, ohigh = other._range[key]
+            self._range[key] = [olow if low is None else min(low, olow), ohigh if high is None else max(high, ohigh)]
+        self.games = total
+        self.steps += other.steps
+        self.seconds += other.seconds
+        for cause, count in other.causes.items():
+            self.causes[cause] += count
+        self.score_hist += other.score_hist
+        return self
+
+    def percentile(self, q):
+        cumulative = np.cumsum(self.score_hist)
+        return int(np.searchsorted(cumulative, q / 100 * self.games))
+
+    def to_dict(self):
+        report = {"games": self.games, "steps": self.steps, "causes": dict(self.causes)}
+        for key, (mean, m2) in self._moments.items():
+            low, high = self._range[key]
+            report[key] = {
+                "mean": mean,
+                "std": (m2 / (self.games - 1)) ** 0.5 if self.games > 1 else 0.0,
+                "min": low,
+                "max": high,
+            }
+        report["score"].update({f"p{q}": self.percentile(q) for q in (10, 50, 90, 99)})
+        report["steps_per_cpu_second"] = self.steps / self.seconds if self.seconds else 0.0
+        last = int(np.flatnonzero(self.score_hist)[-1]) + 1 if self.games else 0
+        report["score_histogram"] = self.score_hist[:last].tolist()
+        return report
+
+
+def play(policy, engine, starve=100, max_steps=100000):
+    # one game to the end; returns (score, steps, cause)
+    since_food = 0
+    score = engine.score
+    for steps in range(1, max_steps + 1):
+        game_over, new_score = engine.step(policy(engine))
+        if game_over:
+            return new_score, steps, "collision"
+        if engine.food is None:
+            return new_score, steps, "won"
+        if new_score != score:
+            score = new_score
+            since_food = 0
+        else:
+            since_food += 1
+            if since_food > starve * len(engine.snake):
+                return score, steps, "timeout"
+    return score, max_steps, "timeout"
+
+
+def _play_chunk(task):
+    name, first_seed, count, starve, max_steps = task
+    engine = SnakeEngine()
+    summary = Summary(engine.cols * engine.rows)
+    began = time.process_time()
+    for seed in range(first_seed, first_seed + count):
+        engine.reset(seed)
+        policy = POLICIES[name](seed, engine.cols, engine.rows)
+        summary.add(*play(policy, engine, starve, max_steps))
+    summary.seconds = time.process_time() - began
+    return name, summary
+
+
+def evaluate(policies, games, seed=0, workers=None, chunk=100, starve=100, max_steps=100000, progress=None):
+    # {policy: report dict}; progress(name, summary) is called as chunks land
+    tasks = [(name, seed + start, min(chunk, games - start), starve, max_steps)
+             for name in policies for start in range(0, games, chunk)]
+    summaries = {name: None for name in policies}
+    walls = {}
+    began = time.perf_counter()
+    with mp.Pool(workers) as pool:
+        for name, part in pool.imap_unordered(_play_chunk, tasks):
+            summaries[name] = part if summaries[name] is None else summaries[name].merge(part)
+            if summaries[name].games == games:
+                walls[name] = time.perf_counter() - began
+            if progress is not None:
+                progress(name, summaries[name])
+
+    reports = {}
+    for name, summary in summaries.items():
+        report = summary.to_dict()
+        # policies share the pool, so this is the rate with all of them running
+        report["steps_per_second"] = summary.steps / walls[name]
+        reports[name] = report
+    return reports
+
+
+def print_report(reports):
+    print(f"{'policy':<10} {'games':>8} {'score':>14} {'p50':>5} {'p90':>5} {'length':>16}"
+          f" {'steps/s':>10} {'collision':>10} {'timeout':>8} {'won':>5}")
+    for name, r in reports.items():
+        score = f"{r['score']['mean']:.1f} +- {r['score']['std']:.1f}"
+        length = f"{r['length']['mean']:.0f} +- {r['length']['std']:.0f}"
+        causes = r["causes"]
+        print(f"{name:<10} {r['games']:>8} {score:>14} {r['score']['p50']:>5} {r['score']['p90']:>5} {length:>16}"
+              f" {r['steps_per_second']:>10,.0f} {causes['collision']:>10} {causes['timeout']:>8} {causes['won']:>5}")
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Play seeded games per policy in parallel and summarise them")
+    parser.add_argument("--policy", nargs="+", default=["random", "planner"], choices=sorted(POLICIES))
+    parser.add_argument("--games", type=int, default=1000, help="games per policy")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first game")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--chunk", type=int, default=100, help="games per worker task")
+    parser.add_argument("--starve", type=int, default=100, help="steps per body cell without food before a timeout")
+    parser.add_argument("--max-steps", type=int, default=100000)
+    parser.add_argument("--out", help="write the JSON report here")
+    args = parser.parse_args()
+
+    def progress(name, summary):
+        print(f"\r{name}: {summary.games}/{args.games} games", end="", file=sys.stderr, flush=True)
+
+    reports = evaluate(args.policy, args.games, args.seed, args.workers, args.chunk, args.starve, args.max_steps,
+                       progress)
+    print(file=sys.stderr)
+    print_report(reports)
+    if args.out:
+        settings = {key: getattr(args, key) for key in ("games", "seed", "starve", "max_steps")}
+        with open(args.out, "w") as f:
+            json.dump({"settings": settings, "policies": reports}, f, indent=2)
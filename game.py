@@ -1,22 +1,24 @@
-import pygame
-import random
-from enum import Enum
-from collections import namedtuple
-from grid_processor import GridProcessor
-from grid_view import GridView
-import numpy as np
-
-pygame.init()
-font = pygame.font.Font('arial.ttf', 25)
-#font = pygame.font.SysFont('arial', 25)
-
-class Direction(Enum):
-    RIGHT = 1
-    LEFT = 2
-    UP = 3
-    DOWN = 4
-    
-Point = namedtuple('Point', 'x, y')
+import time
+from snake_engine import Direction
+
+# pygame is imported, and only its display and font modules set up, by the
+# first SnakeGame that renders; the rules and the observation encoding never
+# need it, so importing this module or running headless games stays cheap.
+# The board config and observation encoder (numpy) load with the first
+# SnakeGame too, which keeps `import game` as cheap as snake_engine's.
+pygame = None
+font = None
+
+
+def init_renderer():
+    global pygame, font
+    if font is None:
+        import pygame
+        pygame.display.init()
+        pygame.font.init()
+        font = pygame.font.Font('arial.ttf', 25)
+        #font = pygame.font.SysFont('arial', 25)
+    return pygame
 
 # rgb colors
 WHITE = (255, 255, 255)
@@ -27,52 +29,78 @@ BLACK = (0,0,0)
 HEAD_COLOR = (0, 255, 0)    
 HEAD_COLOR2 = (0, 200, 0)   # new: head inner color (darker green)
 
-
-BLOCK_SIZE = 20
 SPEED = 20
+# a fixed-timestep loop that falls further behind than this drops the
+# missed steps instead of racing to catch up
+MAX_LAG = 0.25
 
 class SnakeGame:
     
-    def __init__(self, w=500, h=500):
-        self.w = w
-        self.h = h
+    def __init__(self, w=500, h=500, engine=None, dirty_rects=False, config=None, render=True):
+        # The rules live in the headless engine; this class only draws it
+        # and feeds it keyboard input. Board, observation and grid view
+        # geometry all come from one BoardConfig.
+        from config import BoardConfig
+        from grid_processor import ObservationEncoder
+        if config is None:
+            if engine is not None:
+                config = BoardConfig(engine.w, engine.h, engine.block_size)
+            else:
+                config = BoardConfig(w, h)
+        self.config = config
+        self.engine = engine if engine is not None else config.engine()
+        self.w = self.engine.w
+        self.h = self.engine.h
+        self.block_size = self.engine.block_size
         # Create grid processor
-        self.grid_processor = GridProcessor()
-        self.grid_view = GridView()
-        
-        # Initialize pygame
-        if not pygame.get_init():
-            pygame.init()
-        
-        self.display = pygame.display.set_mode((self.w + 300, max(self.h, self.grid_view.surface.get_height()) + 100))
-        
-        pygame.display.set_caption('Snake Game with Grid View')
-        
-        
-        
-        self.clock = pygame.time.Clock()
-        
-        # init game state
-        self.direction = Direction.RIGHT
-        
-        # self.head = Point(self.w/2, self.h/2)
-        # self.snake = [self.head, 
-        #               Point(self.head.x-BLOCK_SIZE, self.head.y),
-        #               Point(self.head.x-(2*BLOCK_SIZE), self.head.y)]
-        
+        self.grid_processor = config.grid_processor()
+        self.engine.attach_encoder(ObservationEncoder(self.grid_processor))
 
-        start_x = (self.w // 2) // BLOCK_SIZE * BLOCK_SIZE
-        start_y = (self.h // 2) // BLOCK_SIZE * BLOCK_SIZE
-        self.head = Point(start_x, start_y)
-        self.snake = [self.head, 
-                      Point(self.head.x-BLOCK_SIZE, self.head.y),
-                      Point(self.head.x-(2*BLOCK_SIZE), self.head.y)]
-        
-        self.score = 0
-        self.food = None
-        self._place_food()
+        # render=False plays without a window (and without importing pygame);
+        # such a game can only be driven by a policy through run()
+        self.render = render
+        self.grid_view = None
+        self.display = None
+        self.clock = None
+        if render:
+            init_renderer()
+            self.grid_view = config.grid_view()
+            self.display = pygame.display.set_mode((self.w + 300, max(self.h, self.grid_view.surface.get_height()) + 100))
+            pygame.display.set_caption('Snake Game with Grid View')
+            self.clock = pygame.time.Clock()
 
         self.pressed_direction = None
+
+        self._ai_input = None
+        self._ai_input_version = None
+
+        # With dirty_rects a normal step only repaints the cells that changed
+        # (old tail, old head, new head, food) and the score, then pushes just
+        # those rects to the screen. Resets and multi-step jumps fall back to
+        # a full redraw.
+        self.dirty_rects = dirty_rects
+        self._drawn = None
+        self._score_rect = pygame.Rect(0, 0, 0, 0) if render else None
+
+    @property
+    def snake(self):
+        return self.engine.snake
+
+    @property
+    def head(self):
+        return self.engine.head
+
+    @property
+    def food(self):
+        return self.engine.food
+
+    @property
+    def score(self):
+        return self.engine.score
+
+    @property
+    def direction(self):
+        return self.engine.direction
         
     def _opposite(self, d1, d2):
         return (d1 == Direction.LEFT and d2 == Direction.RIGHT) or \
@@ -80,14 +108,109 @@ class SnakeGame:
                (d1 == Direction.UP and d2 == Direction.DOWN) or \
                (d1 == Direction.DOWN and d2 == Direction.UP)
         
-    def _place_food(self):
-        x = random.randint(0, (self.w-BLOCK_SIZE )//BLOCK_SIZE )*BLOCK_SIZE 
-        y = random.randint(0, (self.h-BLOCK_SIZE )//BLOCK_SIZE )*BLOCK_SIZE
-        self.food = Point(x, y)
-        if self.food in self.snake:
-            self._place_food()
-        
     def play_step(self):
+        # If no key is pressed, don't move — just update UI and wait
+        result = self._frame()
+        if result is None:
+            self._tick()
+            return False, self.score
+
+        game_over, score = result
+        if game_over:
+            return game_over, score
+        
+        # update clock
+        self._tick()
+
+        #print these to check out the outputs of the grids
+        # ai_input = self.get_ai_input()
+        # print(f"Snake Grid:\n{ai_input['snake_grid']}, Direction: {self.direction}")
+        # print(f"Food Grid:\n{ai_input['food_grid']},  Direction: {self.direction}")
+        return game_over, self.score
+
+    def _frame(self, policy=None, events=True, draw=True):
+        # The work of one frame, for play_step and run alike (FrameProfiler
+        # times frames from here): 1. read the keyboard, 2. pick the move,
+        # policy(game) or the held key, 3. step the engine, which moves,
+        # checks for game over and places food, 4. redraw unless the game
+        # just ended. Returns (game_over, score), or None while no key is
+        # held; a policy's None keeps going straight.
+        if events:
+            self._handle_events()
+        if policy is not None:
+            action = policy(self)
+        elif self.pressed_direction is None:
+            if draw:
+                self._update_ui()
+            return None
+        else:
+            action = self.pressed_direction
+        game_over, score = self.engine.step(action)
+        if draw and not game_over:
+            self._update_ui()
+        return game_over, score
+
+    def run(self, policy=None, sim_rate=SPEED, render_every=1, max_fps=None, turbo=False, games=1,
+            max_steps=None):
+        # Fixed-timestep loop: the engine advances sim_rate times a second, or
+        # as fast as it can with turbo, and the screen is redrawn every
+        # render_every steps but at most max_fps times a second (turbo draws
+        # at 60 fps unless told otherwise). policy(game) returns the next
+        # Direction or None to keep going straight; without one the arrow
+        # keys drive and the snake waits while none is held, as in play_step.
+        # Finished games are reset until `games` have been played; returns
+        # their scores. A game made with render=False just simulates, as
+        # fast as it can.
+        if not self.render and policy is None:
+            raise ValueError("a game without rendering needs a policy to play")
+        turbo = turbo or not self.render
+        step_time = 0 if turbo else 1 / sim_rate
+        if max_fps is None and turbo:
+            max_fps = 60
+        frame_time = 1 / max_fps if max_fps else 0
+        clock = time.perf_counter
+
+        scores = []
+        steps = unrendered = 0
+        next_step = last_render = clock()
+        if self.render:
+            self._update_ui()
+        while len(scores) < games and (max_steps is None or steps < max_steps):
+            # draw when this step completes render_every undrawn ones, at
+            # most every frame_time; turbo only reads the keyboard then
+            now = clock()
+            draw = self.render and unrendered + 1 >= render_every and now - last_render >= frame_time
+            result = self._frame(policy, events=self.render and (draw or not turbo), draw=draw)
+            if result is None:
+                # waiting for a key; keep the screen current
+                unrendered = render_every
+            else:
+                game_over, score = result
+                steps += 1
+                if game_over:
+                    scores.append(score)
+                    if len(scores) == games:
+                        break
+                    self.engine.reset()
+                    # show the new game as soon as frame_time allows
+                    unrendered = render_every
+                elif draw:
+                    unrendered = 0
+                else:
+                    unrendered += 1
+            if draw:
+                last_render = now
+
+            if not turbo:
+                next_step += step_time
+                now = clock()
+                if next_step > now:
+                    time.sleep(next_step - now)
+                elif now - next_step > MAX_LAG:
+                    next_step = now
+        return scores
+
+    def _handle_events(self):
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 pygame.quit()
@@ -118,119 +241,144 @@ class SnakeGame:
                     released_dir = key_to_dir.get(event.key)
                     if released_dir == self.pressed_direction:
                         self.pressed_direction = None
-        
-        # If no key is pressed, don't move — just update UI and wait
-        if not self.pressed_direction:
-            self._update_ui()
-            self.clock.tick(SPEED)
-            return False, self.score
 
-        # 2. move while key held (continuous movement)
-        self.direction = self.pressed_direction
-        self._move(self.direction) # update the head
-        self.snake.insert(0, self.head)
-        
-        # 3. check if game over
-        game_over = False
-        if self._is_collision():
-            game_over = True
-            return game_over, self.score
-            
-        # 4. place new food or just move
-        if self.head == self.food:
-            self.score += 1
-            self._place_food()
-        else:
-            self.snake.pop()
-        
-        # 5. update ui and clock
-        self._update_ui()
+    def _tick(self):
         self.clock.tick(SPEED)
-
-        ai_input = self.get_ai_input()
-        #print these to check out the outputs of the grids
-        # print(f"Snake Grid:\n{ai_input['snake_grid']}, Direction: {self.direction}")
-        # print(f"Food Grid:\n{ai_input['food_grid']},  Direction: {self.direction}")
-        return game_over, self.score
-        
         
 
-    def _is_collision(self):
-        if self.head == self.snake[-1]:
-            return False
-        return self.head in self.snake[1:]
-    
     def get_ai_input(self):
-        return self.grid_processor.get_normalized_input(self.snake, self.food, self.direction)
+        # same grids as grid_processor.get_normalized_input, built incrementally
+        # and at most once per engine state, so the grid view, an agent and any
+        # logging all share them; they are read-only for that reason, and
+        # every new state gets new arrays, so observations can be kept
+        if self._ai_input_version != self.engine.version:
+            self._ai_input = self.engine.encoder.encode(self.food, self.direction)
+            for grid in self._ai_input.values():
+                grid.flags.writeable = False
+            self._ai_input_version = self.engine.version
+        return dict(self._ai_input)
     
     def _update_ui(self):
+        # Draw grid view on the right side
+        # grid_surface = self.grid_view.update(self)
+        
+        
+        ai_input = self.get_ai_input()
+        grid_surface = self.grid_view.update(snake_grid = ai_input["snake_grid"], food_grid = ai_input["food_grid"])
+
+        # a reset swaps in a new snake deque, so comparing identity catches it
+        drawn = self._drawn
+        if self.dirty_rects and drawn is not None and drawn[0] is self.snake \
+                and self.engine.frame_iteration - drawn[1] <= 1:
+            rects = self._draw_changes()
+            self.display.blit(grid_surface, (self.w + 10, 0))
+            rects.append(grid_surface.get_rect(topleft=(self.w + 10, 0)))
+            self._present(rects)
+        else:
+            self._draw_board()
+            self.display.blit(grid_surface, (self.w + 10, 0))
+            self._present()
+
+        self._drawn = (self.snake, self.engine.frame_iteration, self.head, self.snake[-1],
+                       len(self.snake), self.food, self.score)
+
+    def _present(self, rects=None):
+        # push the frame to the screen: the given rects, or all of it
+        if rects is None:
+            pygame.display.flip()
+        else:
+            pygame.display.update(rects)
+
+    def _draw_board(self):
         self.display.fill(BLACK)
         
         # Draw main game
         for i, pt in enumerate(self.snake):
             if i == 0:
-                outer = HEAD_COLOR
-                inner = HEAD_COLOR2
+                self._draw_cell(pt, HEAD_COLOR, HEAD_COLOR2)
             else:
-                outer = BLUE1
-                inner = BLUE2
-            pygame.draw.rect(self.display, outer, pygame.Rect(pt.x, pt.y, BLOCK_SIZE, BLOCK_SIZE))
-            pygame.draw.rect(self.display, inner, pygame.Rect(pt.x+4, pt.y+4, 12, 12))
+                self._draw_cell(pt, BLUE1, BLUE2)
             
-        pygame.draw.rect(self.display, RED, pygame.Rect(self.food.x, self.food.y, BLOCK_SIZE, BLOCK_SIZE))
+        if self.food:
+            self._draw_food()
         
         text = font.render("Score: " + str(self.score), True, WHITE)
-        self.display.blit(text, [0, 0])
+        self._score_rect = self.display.blit(text, [0, 0])
 
-        # Draw grid view on the right side
-        # grid_surface = self.grid_view.update(self)
-        
-        
-        ai_input = self.grid_processor.get_normalized_input(self.snake, self.food, self.direction)
-        grid_surface = self.grid_view.update(snake_grid = ai_input["snake_grid"], food_grid = ai_input["food_grid"])
+    def _draw_cell(self, pt, outer, inner):
+        rect = pygame.Rect(pt.x, pt.y, self.block_size, self.block_size)
+        pygame.draw.rect(self.display, outer, rect)
+        inset = self.block_size // 5
+        pygame.draw.rect(self.display, inner, pygame.Rect(pt.x+inset, pt.y+inset, self.block_size-2*inset, self.block_size-2*inset))
+        return rect
 
-        self.display.blit(grid_surface, (self.w + 10, 0))
-        pygame.display.flip()
-        
-    def _move(self, direction):
-
-        x = int(self.head.x)
-        y = int(self.head.y)
-        if direction == Direction.RIGHT:
-            x += BLOCK_SIZE
-        elif direction == Direction.LEFT:
-            x -= BLOCK_SIZE
-        elif direction == Direction.DOWN:
-            y += BLOCK_SIZE
-        elif direction == Direction.UP:
-            y -= BLOCK_SIZE
-            
+    def _draw_food(self):
+        return pygame.draw.rect(self.display, RED, pygame.Rect(self.food.x, self.food.y, self.block_size, self.block_size))
 
-        if x < 0:
-            x = self.w - BLOCK_SIZE
-        elif x > self.w - BLOCK_SIZE:
-            x = 0
-        if y < 0:
-            y = self.h - BLOCK_SIZE
-        elif y > self.h - BLOCK_SIZE:
-            y = 0
+    def _draw_changes(self):
+        _, steps, old_head, old_tail, old_length, old_food, old_score = self._drawn
+        if self.engine.frame_iteration == steps:
+            return []
 
-        self.head = Point(x, y)
-            
+        rects = []
+        if len(self.snake) == old_length:
+            # the tail moved on; the new head is drawn over it if it went there
+            rects.append(self.display.fill(BLACK, pygame.Rect(old_tail.x, old_tail.y, self.block_size, self.block_size)))
+        if len(self.snake) > 1:
+            rects.append(self._draw_cell(old_head, BLUE1, BLUE2))
+        rects.append(self._draw_cell(self.head, HEAD_COLOR, HEAD_COLOR2))
+        if self.food and self.food != old_food:
+            rects.append(self._draw_food())
 
-if __name__ == '__main__':
-    game = SnakeGame(w=500, h=500)  
-    
-    # game loop
-    while True:
-        game_over, score = game.play_step()
-        
-        if game_over == True:
-            break
+        if self.score != old_score or self._score_rect.collidelist(rects) != -1:
+            rects.append(self._draw_score_area())
+        return rects
+
+    def _draw_score_area(self):
+        # the score sits on top of the board, so repaint whatever is under it
+        text = font.render("Score: " + str(self.score), True, WHITE)
+        area = self._score_rect.union(text.get_rect())
+        self.display.fill(BLACK, area)
+        dirty = area.copy()
+        for i, pt in enumerate(self.snake):
+            if area.colliderect(pygame.Rect(pt.x, pt.y, self.block_size, self.block_size)):
+                if i == 0:
+                    dirty.union_ip(self._draw_cell(pt, HEAD_COLOR, HEAD_COLOR2))
+                else:
+                    dirty.union_ip(self._draw_cell(pt, BLUE1, BLUE2))
+        if self.food and area.colliderect(pygame.Rect(self.food.x, self.food.y, self.block_size, self.block_size)):
+            dirty.union_ip(self._draw_food())
+        self._score_rect = self.display.blit(text, [0, 0])
+        return dirty
         
-    print('Final Score', score)
+if __name__ == '__main__':
+    import argparse
+    import random
+
+    parser = argparse.ArgumentParser(description="Play snake with the arrow keys, or watch a random policy")
+    parser.add_argument("--sim-rate", type=float, default=SPEED, help="simulation steps per second")
+    parser.add_argument("--render-every", type=int, default=1, help="redraw every k-th step")
+    parser.add_argument("--max-fps", type=float, help="redraw at most this often")
+    parser.add_argument("--turbo", action="store_true", help="simulate as fast as possible")
+    parser.add_argument("--random", action="store_true", help="let a random policy play")
+    parser.add_argument("--games", type=int, default=1)
+    parser.add_argument("--headless", action="store_true", help="don't draw (needs --random)")
+    args = parser.parse_args()
+
+    game = SnakeGame(w=500, h=500, render=not args.headless)
+    policy = None
+    if args.random:
+        rng = random.Random()
+        policy = lambda g: rng.choice(list(Direction)) if rng.random() < 0.2 else None
+
+    scores = game.run(policy, args.sim_rate, args.render_every, args.max_fps, args.turbo, args.games)
+
+    print('Final Score', scores[-1] if scores else game.score)
+    if args.games > 1:
+        print('Scores', scores)
         
         
 
-    pygame.quit()
+    if pygame is not None:
+        pygame.quit()
 
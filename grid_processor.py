@@ -1,12 +1,111 @@
 import numpy as np
-from collections import namedtuple
+from itertools import chain
+from collections import namedtuple, OrderedDict
+from snake_engine import Direction, DELTAS
 
 Point = namedtuple('Point', 'x, y')
 
+# rotate_vector as 2x2 matrices, indexed by Direction.value - 1
+_ROTATION_MATRICES = np.array([
+    [[0, 1], [-1, 0]],   # RIGHT
+    [[0, -1], [1, 0]],   # LEFT
+    [[1, 0], [0, 1]],    # UP
+    [[-1, 0], [0, -1]],  # DOWN
+])
+
+# Observation encodings:
+#   dense    {"snake_grid", "food_grid"} int64 grids, as get_normalized_input
+#   compact  {"snake_grid", "food"}: the snake grid in the smallest signed
+#            dtype that holds the board's cell count, food as a view (x, y) or None
+#   packed   {"occupancy", "length", "moves", "food"}: occupied cells as a
+#            packbits plane, and the body as one 2-bit move per segment
+#            starting from the head at the centre (Direction.value - 1 codes,
+#            four per byte, lowest bits first)
+# decode() turns any of them back into the dense grids exactly.
+ENCODINGS = ('dense', 'compact', 'packed')
+
+# view_index entries kept per GridProcessor, by bytes so large grids hold
+# fewer of them; the 4 * 25 * 25 views of the default grid all fit
+VIEW_CACHE_BYTES = 32 * 1024 * 1024
+
+# view-frame steps per move code, indexed by Direction.value - 1
+_MOVE_DX, _MOVE_DY = np.array([DELTAS[Direction(value)] for value in range(1, 5)]).T
+
+# Actions relative to the head-centred view, in which the snake always faces
+# up: FORWARD, TURN_RIGHT, REVERSE, TURN_LEFT are the view's up, right, down
+# and left. to_absolute / to_relative convert between them and Direction
+# values given each game's current direction.
+FORWARD = 0
+TURN_RIGHT = 1
+REVERSE = 2
+TURN_LEFT = 3
+NUM_ACTIONS = 4
+
+# absolute directions in clockwise order, and each Direction.value's place in it
+_CLOCKWISE = np.array([Direction.UP.value, Direction.RIGHT.value, Direction.DOWN.value, Direction.LEFT.value])
+_CLOCKWISE_INDEX = np.zeros(5, dtype=np.intp)
+_CLOCKWISE_INDEX[_CLOCKWISE] = np.arange(4)
+
+
+def _direction_values(directions):
+    # Direction members or their values -> an intp array of values
+    directions = np.asarray(directions)
+    if directions.dtype == object:
+        directions = np.array([d.value for d in directions.ravel()]).reshape(directions.shape)
+    return directions.astype(np.intp)
+
+
+def to_absolute(actions, directions):
+    # relative actions and current Direction values -> Direction values
+    return _CLOCKWISE[(_CLOCKWISE_INDEX[_direction_values(directions)] + np.asarray(actions)) % 4]
+
+
+def to_relative(absolute, directions):
+    # Direction values and current Direction values -> relative actions
+    return (_CLOCKWISE_INDEX[np.asarray(absolute)] - _CLOCKWISE_INDEX[_direction_values(directions)]) % 4
+
 class GridProcessor:
-    def __init__(self, grid_size=25, block_size=20):
+    def __init__(self, grid_size=25, block_size=20, encoding='dense', view_cache_size=None, view_radius=None,
+                 rows=None):
+        # grid_size is the board width in cells and rows its height, the
+        # same by default. With view_radius set the observations are the
+        # (2 * view_radius + 1)^2 cells around the head, in the same
+        # orientation, instead of the whole board; a board that is not
+        # square has no whole-board view that keeps its shape as the snake
+        # turns, so it needs one.
+        if encoding not in ENCODINGS:
+            raise ValueError(f"encoding must be one of {ENCODINGS}, not {encoding!r}")
+        if encoding == 'packed' and view_radius is not None:
+            raise ValueError("the packed encoding needs the whole board in view")
+        rows = grid_size if rows is None else rows
+        if rows != grid_size and view_radius is None:
+            raise ValueError(f"a {grid_size}x{rows} board needs a view_radius; only square boards fit in view whole")
         self.grid_size = grid_size
+        self.cols = grid_size
+        self.rows = rows
         self.block_size = block_size
+        self.encoding = encoding
+        self.view_radius = view_radius
+        self.view_size = grid_size if view_radius is None else 2 * view_radius + 1
+        self.compact_dtype = np.min_scalar_type(-grid_size * rows)
+        if view_cache_size is None:
+            view_cache_size = max(16, VIEW_CACHE_BYTES // (self.view_size * self.view_size * 4))
+        self.view_cache_size = view_cache_size
+        self._view_index_cache = OrderedDict()
+        self._view_offsets = self._build_view_offsets()
+        # world-frame scratch grid, kept at -1 between calls
+        self._world = np.full(grid_size * rows, -1)
+
+        # wrap of a cell difference d in [-(n - 1), n - 1] into
+        # [-(n // 2), n // 2], indexed by d + n - 1, along x and y
+        self._wrap_x = self._wrap_table(grid_size)
+        self._wrap_y = self._wrap_table(rows)
+        self._rotations = [tuple(map(tuple, m.tolist())) for m in _ROTATION_MATRICES]
+
+    @staticmethod
+    def _wrap_table(n):
+        half = n // 2
+        return [d - n if d > half else d + n if d < -half else d for d in range(-(n - 1), n)]
 
     def create_snake_grid(self, snake):
         grid = np.full((self.grid_size, self.grid_size), -1)
@@ -57,77 +156,337 @@ class GridProcessor:
         return rolled
     
     def get_normalized_input(self, snake, food, direction):
+        # The rotated, head-centred snake grid is one gather from the world
+        # grid through view_index, and the food position comes from
+        # food_view_position; both match the rotate_grid / center_grid /
+        # rotate_vector pipeline cell for cell. Food outside the view (on
+        # even grid sizes the wrapped offset can land one past the edge) is
+        # left off, as in the batch path and ObservationEncoder.
+        cells = self._segment_cells(snake)
+        head_x, head_y = int(cells[0] % self.cols), int(cells[0] // self.cols)
+        centered_snake = self._snake_view(cells, self.view_index(direction, head_x, head_y))
+
+        centered_food = np.full((self.view_size, self.view_size), -1)
+        position = self.food_view_position(head_x, head_y, food, direction)
+        if position is not None:
+            centered_food[position[1], position[0]] = 1
 
-        # Create grids in world coordinates
-        snake_grid = self.create_snake_grid(snake)
-        food_grid = self.create_food_grid(food)
+        return {"snake_grid": centered_snake, "food_grid": centered_food}
 
-        world_head_pos = np.where(snake_grid == 1)
-        world_head_x = int(world_head_pos[1][0])  
-        world_head_y = int(world_head_pos[0][0])  
+    def _segment_cells(self, snake):
+        # fromiter over the flattened points is several times faster than
+        # np.asarray on a list of namedtuples
+        xy = np.fromiter(chain.from_iterable(snake), dtype=np.float64, count=2 * len(snake)).reshape(-1, 2)
+        xy = (xy // self.block_size).astype(np.intp) % (self.cols, self.rows)
+        return xy[:, 1] * self.cols + xy[:, 0]
 
-        food_pos = np.where(food_grid == 1)
-        if len(food_pos[0]) > 0:  # Food exists
-            world_food_x = int(food_pos[1][0])
-            world_food_y = int(food_pos[0][0])
+    def _snake_view(self, cells, index):
+        # scatter the body into the scratch world grid, gather the view and
+        # clear only the cells that were written: O(length + view cells)
+        world = self._world
+        # later segments win on shared cells, like create_snake_grid
+        np.maximum.at(world, cells, np.arange(1, len(cells) + 1))
+        view = np.take(world, index).reshape(self.view_size, self.view_size)
+        world[cells] = -1
+        return view
 
-            dx = world_food_x - world_head_x
-            dy = world_food_y - world_head_y
+    def _build_view_offsets(self):
+        # world (dx, dy) from the head shown at each cell of the view, per
+        # Direction.value - 1: the offset from the view centre turned back by
+        # the rotate_vector matrix. rotate_grid followed by center_grid picks
+        # the same cells, so this is also the whole-board view, on even grid
+        # sizes as well.
+        center = self.view_size // 2
+        vy, vx = np.divmod(np.arange(self.view_size ** 2), self.view_size)
+        vx -= center
+        vy -= center
+        m = _ROTATION_MATRICES
+        dx = m[:, 0, 0, None] * vx + m[:, 1, 0, None] * vy
+        dy = m[:, 0, 1, None] * vx + m[:, 1, 1, None] * vy
+        return dx.astype(np.intp), dy.astype(np.intp)
 
-            half_grid = self.grid_size // 2  
+    def _view_cells(self, direction_values, head_x, head_y):
+        # flat world cell at every view cell, for any shape of heads
+        cols = self.cols
+        dx, dy = self._view_offsets
+        k = np.asarray(direction_values) - 1
+        head_x = np.asarray(head_x)[..., None]
+        head_y = np.asarray(head_y)[..., None]
+        return ((head_y + dy[k]) % self.rows) * cols + (head_x + dx[k]) % cols
 
-            if dx > half_grid:
-                dx = dx - self.grid_size
-            elif dx < -half_grid:  
-                dx = dx + self.grid_size
+    def view_index(self, direction, head_x, head_y):
+        # Flat world cell that get_normalized_input shows at each cell of the
+        # rotated, head-centred snake grid; the same cells rotate_grid and
+        # center_grid pick, worked out from the view offsets. The most
+        # recently used view_cache_size of them are kept.
+        key = (direction.value, head_x, head_y)
+        cache = self._view_index_cache
+        index = cache.get(key)
+        if index is None:
+            dtype = np.int32 if self.cols * self.rows < 2 ** 31 else np.int64
+            index = self._view_cells(direction.value, head_x, head_y).astype(dtype)
+            cache[key] = index
+            if len(cache) > self.view_cache_size:
+                cache.popitem(last=False)
+        else:
+            cache.move_to_end(key)
+        return index
 
-            if dy > half_grid:
-                dy = dy - self.grid_size
-            elif dy < -half_grid:
-                dy = dy + self.grid_size
+    def food_view_position(self, head_x, head_y, food, direction):
+        # (x, y) of the food in the head-centred grid, or None when there is
+        # no food or it falls outside the grid; the same wrap and
+        # rotate_vector as get_normalized_input always did, through tables
+        if not food:
+            return None
+        cols, rows = self.cols, self.rows
+        food_x, food_y = int(food.x // self.block_size), int(food.y // self.block_size)
+        if not (0 <= food_x < cols and 0 <= food_y < rows):
+            return None
 
-            if not (-half_grid <= dx <= half_grid):
-                print(f" WARNING: dx={dx} out of valid range [-{half_grid}, {half_grid}]")
-            if not (-half_grid <= dy <= half_grid):
-                print(f" WARNING: dy={dy} out of valid range [-{half_grid}, {half_grid}]")
+        dx = self._wrap_x[food_x - head_x + cols - 1]
+        dy = self._wrap_y[food_y - head_y + rows - 1]
+        (a, b), (c, d) = self._rotations[direction.value - 1]
+        size = self.view_size
+        x = size // 2 + a * dx + b * dy
+        y = size // 2 + c * dx + d * dy
+        if 0 <= x < size and 0 <= y < size:
+            return x, y
+        return None
 
-            rotated_dx, rotated_dy = self.rotate_vector(dx, dy, direction)
+    def snake_view_batch(self, world_grids, head_cells, directions):
+        # world_grids: (B, cells) world-frame snake grids, head_cells: (B,)
+        # flat head cells, directions: (B,) Direction values
+        cols = self.cols
+        size = self.view_size
+        world_grids = np.ascontiguousarray(world_grids)
+        batch = world_grids.shape[0]
+        head_cells = np.asarray(head_cells)
+        index = self._view_cells(_direction_values(directions), head_cells % cols, head_cells // cols)
+        index += (np.arange(batch, dtype=np.intp) * (cols * self.rows))[:, None]
+        return np.take(world_grids, index).reshape(batch, size, size)
 
-            if not (-half_grid <= rotated_dx <= half_grid):
-                print(f" WARNING: After rotation, rotated_dx={rotated_dx} out of valid range!")
-                print(f"   Original (dx, dy) = ({dx}, {dy}), Direction = {direction.name}")
-            if not (-half_grid <= rotated_dy <= half_grid):
-                print(f" WARNING: After rotation, rotated_dy={rotated_dy} out of valid range!")
-                print(f"   Original (dx, dy) = ({dx}, {dy}), Direction = {direction.name}")
-        else:
-            rotated_dx, rotated_dy = None, None
+    def food_view_batch(self, head_cells, food_cells, directions):
+        # one-hot food grids of the head-centred view; food_cells < 0 means
+        # no food
+        cols, rows = self.cols, self.rows
+        size = self.view_size
+        center = size // 2
+        head_cells = np.asarray(head_cells)
+        food_cells = np.asarray(food_cells)
+        batch = head_cells.shape[0]
+
+        dx = food_cells % cols - head_cells % cols
+        dy = food_cells // cols - head_cells // cols
+        dx = np.where(dx > cols // 2, dx - cols, np.where(dx < -(cols // 2), dx + cols, dx))
+        dy = np.where(dy > rows // 2, dy - rows, np.where(dy < -(rows // 2), dy + rows, dy))
+
+        m = _ROTATION_MATRICES[_direction_values(directions) - 1]
+        x = center + m[:, 0, 0] * dx + m[:, 0, 1] * dy
+        y = center + m[:, 1, 0] * dx + m[:, 1, 1] * dy
+
+        grid = np.full((batch, size, size), -1)
+        ok = (food_cells >= 0) & (x >= 0) & (x < size) & (y >= 0) & (y < size)
+        grid[np.flatnonzero(ok), y[ok], x[ok]] = 1
+        return grid
+
+    @staticmethod
+    def batch_arrays(states):
+        # (snake, food, direction) states as SnakeEngine holds them -> the
+        # (snakes, lengths, foods, directions) get_normalized_input_batch takes
+        lengths = [len(snake) for snake, _, _ in states]
+        snakes = np.zeros((len(states), max(lengths), 2), dtype=np.int64)
+        for b, (snake, _, _) in enumerate(states):
+            snakes[b, :lengths[b]] = snake
+        foods = [food if food else (-1, -1) for _, food, _ in states]
+        directions = [direction.value for _, _, direction in states]
+        return snakes, lengths, foods, directions
+
+    def get_normalized_input_batch(self, snakes, lengths, foods, directions):
+        # snakes: (B, L, 2) pixel (x, y) per segment, head first, rows padded
+        # past lengths[b]; foods: (B, 2) pixel (x, y), negative for no food;
+        # directions: (B,) Direction values. Same grids as calling
+        # get_normalized_input on each state, stacked to (B, view, view).
+        cols, rows = self.cols, self.rows
+        snakes = np.asarray(snakes)
+        lengths = np.asarray(lengths)
+        foods = np.asarray(foods)
+        batch, max_len = snakes.shape[:2]
 
-        rotated_snake = self.rotate_grid(snake_grid, direction)
+        xs = (snakes[..., 0] // self.block_size).astype(np.intp) % cols
+        ys = (snakes[..., 1] // self.block_size).astype(np.intp) % rows
+        cells = ys * cols + xs
+        valid = np.arange(max_len)[None, :] < lengths[:, None]
 
-        rotated_head_pos = np.where(rotated_snake == 1)
-        rotated_head_x = int(rotated_head_pos[1][0])
-        rotated_head_y = int(rotated_head_pos[0][0])
+        # later segments win on shared cells, like create_snake_grid
+        world = np.full((batch, cols * rows), -1)
+        games = np.broadcast_to(np.arange(batch)[:, None], cells.shape)
+        values = np.broadcast_to(np.arange(1, max_len + 1)[None, :], cells.shape)
+        np.maximum.at(world, (games[valid], cells[valid]), values[valid])
 
-        centered_snake = self.center_grid(rotated_snake, (rotated_head_x, rotated_head_y))
+        food_x = (foods[:, 0] // self.block_size).astype(np.intp)
+        food_y = (foods[:, 1] // self.block_size).astype(np.intp)
+        has_food = (food_x >= 0) & (food_x < cols) & (food_y >= 0) & (food_y < rows)
+        food_cells = np.where(has_food, food_y * cols + food_x, -1)
 
-        if rotated_dx is not None and rotated_dy is not None:
-            centered_food = np.full((self.grid_size, self.grid_size), -1)
-            food_centered_x = self.grid_size // 2 + rotated_dx
-            food_centered_y = self.grid_size // 2 + rotated_dy
+        head_cells = cells[:, 0]
+        return {"snake_grid": self.snake_view_batch(world, head_cells, directions),
+                "food_grid": self.food_view_batch(head_cells, food_cells, directions)}
 
-            if not (0 <= food_centered_x < self.grid_size and 0 <= food_centered_y < self.grid_size):
-                print(f"FOOD OUT OF BOUNDS!")
-                print(f"   World head: ({world_head_x}, {world_head_y})")
-                print(f"   World food: ({world_food_x}, {world_food_y})")
-                print(f"   World relative (dx, dy): ({dx}, {dy}) [after wrap]")
-                print(f"   Direction: {direction}")
-                print(f"   Rotated relative (rotated_dx, rotated_dy): ({rotated_dx}, {rotated_dy})")
-                print(f"   Final position: ({food_centered_x}, {food_centered_y})")
-                print(f"   Grid size: {self.grid_size}, Center: {self.grid_size // 2}")
 
-            if 0 <= food_centered_x < self.grid_size and 0 <= food_centered_y < self.grid_size:
-                centered_food[food_centered_y][food_centered_x] = 1
+    def get_encoded_input(self, snake, food, direction):
+        # get_normalized_input in self.encoding
+        g = self.grid_size
+        head_x = int(snake[0].x // self.block_size) % self.cols
+        head_y = int(snake[0].y // self.block_size) % self.rows
+        index = self.view_index(direction, head_x, head_y)
+        food = self.food_view_position(head_x, head_y, food, direction)
+        if self.encoding == 'packed':
+            # view position of every segment, through the inverse of the view
+            position = np.empty(g * g, dtype=np.intp)
+            position[index] = np.arange(g * g)
+            cells = [(int(s.y // self.block_size) % g) * g + int(s.x // self.block_size) % g for s in snake]
+            view = position[cells]
+            return self._pack(view % g, view // g, food)
+
+        snake_grid = self._snake_view(self._segment_cells(snake), index)
+        if self.encoding == 'compact':
+            return {"snake_grid": snake_grid.astype(self.compact_dtype), "food": food}
+        return {"snake_grid": snake_grid, "food_grid": self._food_grid(food)}
+
+    def encode(self, obs):
+        # dense observation -> self.encoding
+        g = self.view_size
+        snake_grid = np.asarray(obs["snake_grid"])
+        food_grid = np.asarray(obs["food_grid"])
+        if self.encoding == 'dense':
+            return {"snake_grid": snake_grid, "food_grid": food_grid}
+
+        food_cell = int(np.argmax(food_grid == 1))
+        food = (food_cell % g, food_cell // g) if food_grid.flat[food_cell] == 1 else None
+        if self.encoding == 'compact':
+            return {"snake_grid": snake_grid.astype(self.compact_dtype), "food": food}
+
+        # the body order is read back from the indices, which needs every
+        # segment visible; a body crossing itself hides the earlier index
+        flat = snake_grid.ravel()
+        cells = np.flatnonzero(flat > 0)
+        length = int(flat.max(initial=0))
+        if len(cells) != length:
+            raise ValueError("the snake overlaps itself; use get_encoded_input() with the snake instead")
+        cells = cells[np.argsort(flat[cells])]
+        return self._pack(cells % g, cells // g, food)
+
+    def _pack(self, xs, ys, food):
+        g = self.grid_size
+        xs = np.asarray(xs)
+        ys = np.asarray(ys)
+        dx = np.diff(xs) % g
+        dy = np.diff(ys) % g
+        codes = np.full(len(dx), -1)
+        for code in range(4):
+            codes[(dx == _MOVE_DX[code] % g) & (dy == _MOVE_DY[code] % g)] = code
+        if (codes < 0).any():
+            raise ValueError("consecutive segments are not adjacent on this grid")
+
+        occupancy = np.zeros(g * g, dtype=bool)
+        occupancy[ys * g + xs] = True
+        codes = codes.astype(np.uint8)
+        bits = np.stack([codes & 1, codes >> 1], axis=1).ravel()
+        return {"occupancy": np.packbits(occupancy),
+                "length": len(xs),
+                "moves": np.packbits(bits, bitorder='little'),
+                "food": food}
+
+    def _food_grid(self, food):
+        grid = np.full((self.view_size, self.view_size), -1)
+        if food is not None:
+            grid[food[1], food[0]] = 1
+        return grid
+
+    def decode(self, encoded):
+        # any encoding -> the dense grids get_normalized_input returns
+        if "food_grid" in encoded:
+            return encoded
+        g = self.grid_size
+        if "snake_grid" in encoded:
+            snake_grid = np.asarray(encoded["snake_grid"]).astype(np.int64)
         else:
-            centered_food = np.full((self.grid_size, self.grid_size), -1)
+            length = encoded["length"]
+            bits = np.unpackbits(encoded["moves"], count=2 * (length - 1), bitorder='little').reshape(-1, 2)
+            codes = bits[:, 0] | (bits[:, 1] << 1)
+            center = g // 2
+            xs = (center + np.concatenate([[0], np.cumsum(_MOVE_DX[codes])])) % g
+            ys = (center + np.concatenate([[0], np.cumsum(_MOVE_DY[codes])])) % g
+            # later segments win on shared cells, like create_snake_grid
+            flat = np.full(g * g, -1)
+            np.maximum.at(flat, ys * g + xs, np.arange(1, length + 1))
+            snake_grid = flat.reshape(g, g)
+        return {"snake_grid": snake_grid, "food_grid": self._food_grid(encoded["food"])}
+
+
+class ObservationEncoder:
+    # Keeps the world-frame snake grid up to date as the snake moves instead
+    # of rebuilding it every step. Each cell stores the step stamp at which
+    # the head entered it; the body index is t - stamp + 1 and anything past
+    # the current length is empty, so removing the tail only shrinks the
+    # length and nothing is rewritten.
+    #
+    # encode() returns new arrays every call, like get_normalized_input.
+
+    EMPTY = -(2 ** 62)
+
+    def __init__(self, grid_processor):
+        self.grid_processor = grid_processor
+        self._stamps = np.full(grid_processor.cols * grid_processor.rows, self.EMPTY, dtype=np.int64)
+        self.t = 0
+        self.length = 0
+        self.head = None
+
+    def _cell(self, segment):
+        gp = self.grid_processor
+        x = int(segment.x // gp.block_size) % gp.cols
+        y = int(segment.y // gp.block_size) % gp.rows
+        return x, y
+
+    def reset(self, snake):
+        self._stamps.fill(self.EMPTY)
+        self.t = len(snake)
+        self.length = len(snake)
+        # later segments overwrite earlier ones, as in create_snake_grid
+        for i, segment in enumerate(snake):
+            x, y = self._cell(segment)
+            self._stamps[y * self.grid_processor.cols + x] = self.t - i
+        self.head = self._cell(snake[0])
+
+    def push_head(self, head):
+        x, y = self._cell(head)
+        cell = y * self.grid_processor.cols + x
+        # a head on a body cell ran into it and the game is over; that
+        # segment keeps its stamp, as its index wins in create_snake_grid.
+        # The tail's cell is taken over, the tail leaves it this step
+        index = self.t - self._stamps[cell] + 1
+        self.t += 1
+        if not 1 <= index < self.length:
+            self._stamps[cell] = self.t
+        self.length += 1
+        self.head = (x, y)
+
+    def pop_tail(self):
+        self.length -= 1
+
+    def encode(self, food, direction):
+        gp = self.grid_processor
+        head_x, head_y = self.head
+
+        size = gp.view_size
+        snake_grid = np.take(self._stamps, gp.view_index(direction, head_x, head_y)).reshape(size, size)
+        np.subtract(self.t + 1, snake_grid, out=snake_grid)
+        snake_grid[snake_grid > self.length] = -1
+
+        food_grid = np.full((size, size), -1, dtype=np.int64)
+        position = gp.food_view_position(head_x, head_y, food, direction)
+        if position is not None:
+            food_grid[position[1], position[0]] = 1
+
+        return {"snake_grid": snake_grid, "food_grid": food_grid}
 
-        return {"snake_grid": centered_snake, "food_grid": centered_food}
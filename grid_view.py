@@ -1,14 +1,23 @@
 import pygame
 import numpy as np
+from snake_engine import BLOCK_SIZE
+
+# cells narrower than this are filled solid: the grid lines, border and
+# inner square would otherwise cover every pixel of the cell
+SOLID_CELL_SIZE = 5
 
 class GridView:
-    def __init__(self, width=250, height=250, grid_size=25):
+    def __init__(self, width=250, height=250, grid_size=25, block_size=BLOCK_SIZE):
         self.width = width
         self.height = height
         self.grid_size = grid_size
-        self.cell_size = width // grid_size
+        self.block_size = block_size
+        # grids wider than the view in cells get one pixel per cell, drawn
+        # solid like every cell under SOLID_CELL_SIZE
+        self.cell_size = max(1, width // grid_size)
+        self.grid_pixels = self.grid_size * self.cell_size
 
-        self.surface = pygame.Surface((width, self.grid_size * self.cell_size * 2 + 80))
+        self.surface = pygame.Surface((max(width, self.grid_pixels), self.grid_pixels * 2 + 80))
 
         # Colors
         self.bg_color = (0, 0, 0)
@@ -18,11 +27,22 @@ class GridView:
         self.empty_color = (20, 20, 20)
         self.text_color = (255, 255, 255)
         
+        if not pygame.font.get_init():
+            pygame.font.init()
         try:
             self.font = pygame.font.Font('arial.ttf', 10)
         except:
             self.font = pygame.font.SysFont('arial', 10)
 
+        # draw_grid state: per-pixel colour slots, rendered value labels and
+        # the last grid drawn at each offset so unchanged cells are skipped
+        self.show_values = self.cell_size >= 6
+        self._slots = None
+        self._glyphs = {}
+        self._previous = {}
+        self._header_drawn = False
+        self._palette = self._build_palette()
+
     # def draw_grid(self, grid, offset_x=0, offset_y=0, is_food_grid=False):
     #     for y in range(self.grid_size):
     #         for x in range(self.grid_size):
@@ -55,56 +75,110 @@ class GridView:
     #                 offset_y + y * self.cell_size + self.cell_size // 2
     #             ))
     #             self.surface.blit(text, text_rect)
+    def _build_palette(self):
+        # snake cell colour by value + 1: -1 and 0 are empty, 1 is the head,
+        # the body fades out towards the tail
+        values = np.arange(-1, self.grid_size * self.grid_size + 1)
+        fade = np.maximum(50, 255 - (values - 1) * 10)
+        palette = np.zeros((len(values), 3), dtype=np.uint8)
+        palette[:, 1] = np.clip(fade, 0, 255)
+        palette[values < 1] = self.empty_color
+        palette[values == 1] = self.snake_colors[0]
+        return palette
+
+    def _build_slots(self):
+        # Which colour every pixel of a grid takes: its cell's fill colour,
+        # its cell's inner colour, the grid line colour or the background.
+        # Indexed [x, y] like pygame.surfarray.
+        cells = self.grid_size * self.grid_size
+        pixels = np.arange(self.grid_size * self.cell_size)
+        offset_x = (pixels % self.cell_size)[:, None]
+        offset_y = (pixels % self.cell_size)[None, :]
+        inner_end = self.cell_size - 4
+        self._pixel_cells = (pixels // self.cell_size)[None, :] * self.grid_size + (pixels // self.cell_size)[:, None]
+        if self.cell_size < SOLID_CELL_SIZE:
+            self._gap = np.zeros(self._pixel_cells.shape, dtype=bool)
+            self._slots = self._pixel_cells
+            return
+        self._gap = (offset_x == self.cell_size - 1) | (offset_y == self.cell_size - 1)
+
+        slots = self._pixel_cells.copy()
+        inner = (offset_x >= 2) & (offset_x <= inner_end) & (offset_y >= 2) & (offset_y <= inner_end)
+        slots[inner] += cells
+        border = (offset_x == 0) | (offset_x == self.cell_size - 2) | (offset_y == 0) | (offset_y == self.cell_size - 2)
+        slots[border] = 2 * cells
+        slots[self._gap] = 2 * cells + 1
+        self._slots = slots
+
+    def _cell_colors(self, values, is_food_grid):
+        # fill colours, inner colours, grid line and background, in slot order
+        is_marked = (values == 1)[:, None]
+        if is_food_grid:
+            fill = np.where(is_marked, self.food_color, self.empty_color)
+            inner = np.where(is_marked, (255, 150, 150), fill)
+        else:
+            fill = self._palette[np.clip(values + 1, 0, len(self._palette) - 1)]
+            inner = np.where(is_marked, self.snake_colors[1], fill)
+        return np.concatenate([fill, inner, [self.grid_color, self.bg_color]]).astype(np.uint8)
+
+    def _glyph(self, value):
+        # rendered once per value, trimmed and shrunk to fit inside a cell
+        glyph = self._glyphs.get(value)
+        if glyph is None:
+            text = self.font.render(str(value), True, self.text_color)
+            glyph = text.subsurface(text.get_bounding_rect()).copy()
+            box = self.cell_size - 1
+            if glyph.get_width() > box or glyph.get_height() > box:
+                scale = box / max(glyph.get_width(), glyph.get_height())
+                size = (max(1, int(glyph.get_width() * scale)), max(1, int(glyph.get_height() * scale)))
+                glyph = pygame.transform.smoothscale(glyph, size)
+            self._glyphs[value] = glyph
+        return glyph
+
+    def invalidate(self):
+        # force the next update to redraw everything
+        self._previous.clear()
+        self._header_drawn = False
+
     def draw_grid(self, grid, offset_x=0, offset_y=0, is_food_grid=False):
-        for y in range(self.grid_size):
-            for x in range(self.grid_size):
-                value = grid[y][x]
-                rect = pygame.Rect(
-                    offset_x + x * self.cell_size,
-                    offset_y + y * self.cell_size,
-                    self.cell_size - 1,
-                    self.cell_size - 1
-                )
-
-                # Determine cell color
-                if is_food_grid:
-                    color = self.food_color if value == 1 else self.empty_color
-                elif value == -1:
-                    color = self.empty_color
-                elif value == 1:
-                    color = self.snake_colors[0]  
-                elif value > 1:
-                    fade = max(50, 255 - (value - 1) * 10)
-                    color = (0, fade, 0)
-                else:
-                    color = self.empty_color  
-
-                # Draw main rectangle
-                pygame.draw.rect(self.surface, color, rect)
-
-                # Add inner rectangle for food and snake head
-                if (is_food_grid and value == 1) or (not is_food_grid and value == 1):
-                    inner_rect = rect.inflate(-4, -4)
-                    inner_color = (255, 150, 150) if is_food_grid else self.snake_colors[1]
-                    pygame.draw.rect(self.surface, inner_color, inner_rect)
-
-                # Draw grid lines
-                pygame.draw.rect(self.surface, self.grid_color, rect, 1)
-
-                # Draw value numbers
-                text = self.font.render(str(value), True, self.text_color)
-                text_rect = text.get_rect(center=(
-                    offset_x + x * self.cell_size + self.cell_size // 2,
-                    offset_y + y * self.cell_size + self.cell_size // 2
-                ))
-                self.surface.blit(text, text_rect)
+        grid = np.asarray(grid)
+        previous = self._previous.get((offset_x, offset_y))
+        if previous is None or previous.shape != grid.shape:
+            changed = np.ones(grid.shape, dtype=bool)
+        else:
+            changed = grid != previous
+        self._previous[(offset_x, offset_y)] = grid.copy()
+        if not changed.any():
+            return
+
+        if self._slots is None:
+            self._build_slots()
+        colors = self._cell_colors(grid.ravel(), is_food_grid)
+
+        # repaint only the pixels of changed cells, straight into the surface
+        size = self.grid_size * self.cell_size
+        mask = changed.ravel()[self._pixel_cells] & ~self._gap
+        pixels = pygame.surfarray.pixels3d(self.surface)
+        region = pixels[offset_x:offset_x + size, offset_y:offset_y + size]
+        region[mask] = colors[self._slots[mask]]
+        del region, pixels
+
+        if not self.show_values:
+            return
+        center = (self.cell_size - 1) // 2
+        for y, x in zip(*np.nonzero(changed)):
+            glyph = self._glyph(int(grid[y, x]))
+            self.surface.blit(glyph, glyph.get_rect(center=(
+                offset_x + x * self.cell_size + center,
+                offset_y + y * self.cell_size + center
+            )))
 
 
     def create_snake_grid(self, snake):
         grid = np.full((self.grid_size, self.grid_size), -1)
         for i, segment in enumerate(snake):
-            grid_x = int(segment.x // 20)
-            grid_y = int(segment.y // 20)
+            grid_x = int(segment.x // self.block_size)
+            grid_y = int(segment.y // self.block_size)
             if 0 <= grid_x < self.grid_size and 0 <= grid_y < self.grid_size:
                 grid[grid_y][grid_x] = i + 1 
         return grid
@@ -112,22 +186,24 @@ class GridView:
     def create_food_grid(self, food):
         grid = np.full((self.grid_size, self.grid_size), -1)
         if food:
-            food_x = int(food.x // 20)
-            food_y = int(food.y // 20)
+            food_x = int(food.x // self.block_size)
+            food_y = int(food.y // self.block_size)
             if 0 <= food_x < self.grid_size and 0 <= food_y < self.grid_size:
                 grid[food_y][food_x] = 1
         return grid
 
     def update(self,snake_grid, food_grid):
-        self.surface.fill(self.bg_color)
+        if not self._header_drawn:
+            self.surface.fill(self.bg_color)
 
-        snake_label = self.font.render("Snake Body", True, self.text_color)
-        food_label = self.font.render("Apple", True, self.text_color)
-        self.surface.blit(snake_label, (10, 5))
-        self.surface.blit(food_label, (10, self.height + 25))
+            snake_label = self.font.render("Snake Body", True, self.text_color)
+            food_label = self.font.render("Apple", True, self.text_color)
+            self.surface.blit(snake_label, (10, 5))
+            self.surface.blit(food_label, (10, self.grid_pixels + 25))
+            self._header_drawn = True
 
         self.draw_grid(snake_grid, offset_x=0, offset_y=20, is_food_grid=False)
-        self.draw_grid(food_grid, offset_x=0, offset_y=self.height + 40, is_food_grid=True)
+        self.draw_grid(food_grid, offset_x=0, offset_y=self.grid_pixels + 40, is_food_grid=True)
 
    
         return self.surface
@@ -0,0 +1,302 @@
+import queue
+import threading
+import traceback
+import multiprocessing as mp
+from multiprocessing import shared_memory
+import numpy as np
+from config import BoardConfig
+from rollout import shared_arrays
+
+# Training batches built off the training thread. Sources produce raw game
+# states, (snake, food, direction) as SnakeEngine holds them, plus the move
+# made from each; worker threads or processes encode them with
+# GridProcessor.get_normalized_input_batch straight into preallocated batch
+# slots, and the training loop takes finished slots from a bounded queue.
+#
+#   with TrainingPipeline(ReplaySource("games.rec"), batch_size=512) as batches:
+#       for batch in batches:
+#           loss = model(batch["obs"].to(device, non_blocking=True)) ...
+#
+# batch["obs"] is a (B, 2, V, V) float32 tensor (snake grid, food grid) and
+# batch["actions"] a (B,) int64 tensor of the Direction values moved, 0 when
+# unknown. Both are views of a slot that goes back to the workers when the
+# next batch is requested; copy what you want to keep.
+#
+# With threads the slots are torch tensors, in pinned memory when CUDA is
+# available so the host-to-device copy can be asynchronous. Processes write
+# into shared memory instead, which torch wraps without copying but cannot
+# pin; they pay off when encoding, not the copy, is the bottleneck. Batches
+# still held after close() stay readable: the shared memory is unmapped only
+# once the last of them is gone.
+# tensors=False hands out the numpy arrays and never imports torch.
+
+
+class LiveSource:
+    # games played by a policy from evaluate.POLICIES; every worker runs its
+    # own `games` engines, seeded apart, and never runs out
+
+    def __init__(self, games=64, policy="random", seed=0, config=None):
+        self.games = games
+        self.policy = policy
+        self.seed = seed
+        self.config = config if config is not None else BoardConfig()
+
+    def batches(self, batch_size, worker=0, num_workers=1):
+        from evaluate import POLICIES
+        seeds = np.random.SeedSequence([self.seed, worker]).generate_state(self.games)
+        engines = [self.config.engine(int(s)) for s in seeds]
+        policies = [POLICIES[self.policy](int(s), self.config.cols, self.config.rows) for s in seeds]
+        while True:
+            states = []
+            actions = []
+            while len(states) < batch_size:
+                for engine, policy in zip(engines, policies):
+                    state = (list(engine.snake), engine.food, engine.direction)
+                    game_over, _ = engine.step(policy(engine))
+                    states.append(state)
+                    actions.append(engine.direction.value)
+                    if game_over:
+                        engine.reset()
+                    if len(states) == batch_size:
+                        break
+            yield states, actions
+
+
+class ReplaySource:
+    # every state of a recording, shuffled per epoch; workers take
+    # interleaved shares of the same permutation
+
+    def __init__(self, path, shuffle=True, seed=0, epochs=1, cache_size=256):
+        self.path = path
+        self.shuffle = shuffle
+        self.seed = seed
+        self.epochs = epochs
+        self.cache_size = cache_size
+
+    def batches(self, batch_size, worker=0, num_workers=1):
+        from recording import ReplayDataset
+        dataset = ReplayDataset(self.path, self.cache_size)
+        epoch = 0
+        while self.epochs is None or epoch < self.epochs:
+            order = np.arange(len(dataset))
+            if self.shuffle:
+                np.random.default_rng([self.seed, epoch]).shuffle(order)
+            share = order[worker::num_workers]
+            for start in range(0, len(share), batch_size):
+                states = []
+                actions = []
+                for index in share[start:start + batch_size].tolist():
+                    number, t = dataset.locate(index)
+                    episode = dataset.episode(number)
+                    states.append(episode.state_at(t))
+                    actions.append(int(episode.codes()[t]) + 1 if t < episode.steps else 0)
+                yield states, actions
+            epoch += 1
+
+
+def encode_states(states, grid_processor, out):
+    # (snake, food, direction) states -> out[:, 0] snake and out[:, 1] food
+    # grids, for any out dtype; the same grids as get_normalized_input
+    grids = grid_processor.get_normalized_input_batch(*grid_processor.batch_arrays(states))
+    out[:, 0] = grids["snake_grid"]
+    out[:, 1] = grids["food_grid"]
+    return out
+
+
+def _fill(source, batch_size, worker, num_workers, config, obs, actions, free, ready):
+    # encode the source's batches into free slots until it runs out or a
+    # negative slot asks the worker to stop
+    try:
+        grid_processor = config.grid_processor()
+        for states, moves in source.batches(batch_size, worker, num_workers):
+            slot = free.get()
+            if slot < 0:
+                return
+            n = len(states)
+            encode_states(states, grid_processor, obs[slot, :n])
+            actions[slot, :n] = moves
+            ready.put((slot, n))
+        ready.put((-1, None))
+    except Exception:
+        ready.put((-2, traceback.format_exc()))
+
+
+def _process_worker(source, batch_size, worker, num_workers, config, names, shapes, free, ready):
+    blocks = [shared_memory.SharedMemory(name=name) for name in names]
+    obs = np.ndarray(shapes[0], dtype=np.float32, buffer=blocks[0].buf)
+    actions = np.ndarray(shapes[1], dtype=np.int64, buffer=blocks[1].buf)
+    try:
+        _fill(source, batch_size, worker, num_workers, config, obs, actions, free, ready)
+    finally:
+        del obs, actions
+        for block in blocks:
+            block.close()
+
+
+class TrainingPipeline:
+
+    def __init__(self, source, batch_size=256, workers=2, prefetch=4, processes=False, config=None,
+                 tensors=True, start_method=None):
+        self.source = source
+        self.batch_size = batch_size
+        self.workers = workers
+        self.processes = processes
+        self.config = config if config is not None else BoardConfig()
+        # every worker may hold a slot while encoding and the consumer holds
+        # the one it is training on; the rest is the prefetch depth
+        self.num_slots = prefetch + workers + 1
+        v = self.config.view_size
+        shapes = ((self.num_slots, batch_size, 2, v, v), (self.num_slots, batch_size))
+
+        self._blocks = []
+        self._obs_out = self._actions_out = None
+        if processes:
+            ctx = mp.get_context(start_method)
+            blocks, arrays = shared_arrays({"obs": (shapes[0], np.float32), "actions": (shapes[1], np.int64)})
+            self._blocks = [blocks["obs"], blocks["actions"]]
+            self._obs, self._actions = arrays["obs"], arrays["actions"]
+            self._free = ctx.Queue()
+            self._ready = ctx.Queue()
+            names = [block.name for block in self._blocks]
+            self._workers = [ctx.Process(target=_process_worker, daemon=True,
+                                         args=(source, batch_size, w, workers, self.config, names, shapes,
+                                               self._free, self._ready))
+                             for w in range(workers)]
+        else:
+            self._allocate(shapes, tensors)
+            self._free = queue.Queue()
+            self._ready = queue.Queue()
+            self._workers = [threading.Thread(target=_fill, daemon=True,
+                                              args=(source, batch_size, w, workers, self.config, self._obs,
+                                                    self._actions, self._free, self._ready))
+                             for w in range(workers)]
+
+        # what batches are handed out as: torch views of the slots, or the
+        # slot arrays themselves
+        if self._obs_out is None:
+            if tensors:
+                import torch
+                self._obs_out = torch.from_numpy(self._obs)
+                self._actions_out = torch.from_numpy(self._actions)
+            else:
+                self._obs_out = self._obs
+                self._actions_out = self._actions
+
+        for slot in range(self.num_slots):
+            self._free.put(slot)
+        self._held = None
+        self._started = False
+        self._closed = False
+
+    def _allocate(self, shapes, tensors):
+        # thread slots: the workers write through numpy views of the tensors
+        # that are handed out
+        if not tensors:
+            self._obs = np.empty(shapes[0], dtype=np.float32)
+            self._actions = np.empty(shapes[1], dtype=np.int64)
+            return
+        import torch
+        pin = torch.cuda.is_available()
+        self._obs_out = torch.empty(shapes[0], dtype=torch.float32, pin_memory=pin)
+        self._actions_out = torch.empty(shapes[1], dtype=torch.int64, pin_memory=pin)
+        self._obs = self._obs_out.numpy()
+        self._actions = self._actions_out.numpy()
+
+    def __iter__(self):
+        if not self._started:
+            self._started = True
+            for worker in self._workers:
+                worker.start()
+        finished = 0
+        while finished < self.workers:
+            self._release()
+            slot, info = self._ready.get()
+            if slot == -1:
+                finished += 1
+                continue
+            if slot == -2:
+                raise RuntimeError(f"pipeline worker failed:\n{info}")
+            self._held = slot
+            yield {"obs": self._obs_out[slot, :info], "actions": self._actions_out[slot, :info]}
+        self._release()
+
+    def _release(self):
+        if self._held is not None:
+            self._free.put(self._held)
+            self._held = None
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        for _ in self._workers:
+            self._free.put(-1)
+        if self._started:
+            for worker in self._workers:
+                worker.join(timeout=5)
+                if self.processes and worker.is_alive():
+                    worker.terminate()
+        # the blocks are unmapped by shared_arrays' finalizers once no batch
+        # refers to them; only the names go now
+        self._obs_out = self._actions_out = self._obs = self._actions = None
+        for block in self._blocks:
+            block.unlink()
+        self._blocks = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+if __name__ == '__main__':
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Measure how fast the pipeline feeds a training loop")
+    parser.add_argument("--replay", help="recording to read; default plays live random games")
+    parser.add_argument("--batch", type=int, default=256)
+    parser.add_argument("--batches", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--prefetch", type=int, default=4)
+    parser.add_argument("--processes", action="store_true")
+    parser.add_argument("--numpy", action="store_true", help="hand out numpy arrays, no torch needed")
+    parser.add_argument("--train-ms", type=float, default=5.0, help="simulated training step per batch")
+    args = parser.parse_args()
+
+    source = ReplaySource(args.replay, epochs=None) if args.replay else LiveSource()
+
+    # the same work done synchronously in the training loop, for comparison
+    grid_processor = BoardConfig().grid_processor()
+    out = np.empty((args.batch, 2, 25, 25), dtype=np.float32)
+    batches = source.batches(args.batch)
+    began = time.perf_counter()
+    for _ in range(args.batches):
+        states, _ = next(batches)
+        encode_states(states, grid_processor, out)
+        time.sleep(args.train_ms / 1000)
+    inline = time.perf_counter() - began
+
+    with TrainingPipeline(source, args.batch, args.workers, args.prefetch, args.processes,
+                          tensors=not args.numpy) as pipeline:
+        waited = 0.0
+        began = time.perf_counter()
+        asked = began
+        for i, batch in enumerate(pipeline):
+            waited += time.perf_counter() - asked
+            time.sleep(args.train_ms / 1000)
+            if i + 1 == args.batches:
+                break
+            asked = time.perf_counter()
+        piped = time.perf_counter() - began
+
+    print(f"inline:   {args.batches * args.batch / inline:,.0f} states/s")
+    print(f"pipeline: {args.batches * args.batch / piped:,.0f} states/s, "
+          f"waited {waited / args.batches * 1000:.2f} ms per batch for data")
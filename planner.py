@@ -0,0 +1,355 @@
+import heapq
+from collections import deque
+import numpy as np
+from snake_engine import Direction, DELTAS
+
+# Search-based autopilot for the wraparound board, as a baseline to measure
+# agents against and to generate imitation data.
+#
+# Cells are flat indices y * cols + x, and the board is kept as flat lists:
+# a neighbour table and, while planning, each body cell's time-to-free (the
+# step from which the head may enter it; the tail's is 1 because it moves
+# out as the head moves in). Searches only enter a cell at or after its
+# time-to-free, so a path may run through where the body is now.
+#
+# A planned path to the food is only taken when the snake could still reach
+# its own tail after eating; otherwise, or when there is no food path, the
+# snake follows a Hamiltonian cycle of the torus, or failing that the safe
+# move that leaves it the most room. Paths are cached: as long as the game
+# goes where the planner predicted (same head, length and food) the next
+# move is a list lookup, and it replans only when the food moves or the
+# prediction breaks, e.g. after a reset.
+#
+#   planner = Planner()
+#   engine.step(planner.engine_action(engine))
+#   actions = BatchPlanner(env).act()          # for BatchSnakeEnv.step
+
+# neighbour order follows Direction.value - 1
+_DX, _DY = zip(*(DELTAS[Direction(value)] for value in range(1, 5)))
+_DIRECTIONS = (None, Direction.RIGHT, Direction.LEFT, Direction.UP, Direction.DOWN)
+
+
+def hamiltonian_cycle(cols, rows):
+    # Visit the board line by line, crossing each line in full before
+    # stepping to the next; a line crossed rightwards ends one cell left of
+    # where it started, one crossed leftwards one cell right. The shifts only
+    # have to add up to a multiple of the line length for the last step to
+    # wrap back to the start, which some mix of directions always manages on
+    # a torus: alternate with an even number of lines, otherwise lay lines
+    # along the shorter side and cross (lines + length) / 2 of them rightwards.
+    if rows % 2 == 0:
+        lines, length, transpose = rows, cols, False
+    elif cols % 2 == 0 or cols > rows:
+        lines, length, transpose = cols, rows, True
+    else:
+        lines, length, transpose = rows, cols, False
+    if lines % 2 == 0:
+        rightward = [line % 2 == 0 for line in range(lines)]
+    else:
+        lefts = (lines - length) // 2
+        rightward = [line % 2 == 0 if line < 2 * lefts else True for line in range(lines)]
+
+    order = []
+    start = 0
+    for line in range(lines):
+        step = 1 if rightward[line] else -1
+        for i in range(length):
+            along = (start + step * i) % length
+            order.append(line * cols + along if not transpose else along * cols + line)
+        start = (start + step * (length - 1)) % length
+    return order
+
+
+class Planner:
+
+    def __init__(self, cols=25, rows=25, method="astar", check_tail=True, cycle_segment=None):
+        # method is "astar" or "bfs"; check_tail=False eats greedily.
+        # cycle_segment is how far along the Hamiltonian cycle to commit
+        # before looking for a food path again (default: one board width)
+        if method not in ("astar", "bfs"):
+            raise ValueError(f"method must be 'astar' or 'bfs', not {method!r}")
+        self.cols = cols
+        self.rows = rows
+        self.method = method
+        self.check_tail = check_tail
+        self.cycle_segment = cycle_segment or cols
+        n = cols * rows
+        self.num_cells = n
+        self.xs = [c % cols for c in range(n)]
+        self.ys = [c // cols for c in range(n)]
+        self.neighbours = [tuple(((self.xs[c] + dx) % cols) + ((self.ys[c] + dy) % rows) * cols
+                                 for dx, dy in zip(_DX, _DY)) for c in range(n)]
+
+        cycle = hamiltonian_cycle(cols, rows)
+        self.cycle_next = [0] * n
+        for i, c in enumerate(cycle):
+            self.cycle_next[c] = cycle[(i + 1) % n]
+
+        # search scratch, reused: time-to-free per cell (0 = free) and
+        # generation-stamped visited marks so nothing is cleared per search
+        self._free_at = [0] * n
+        self._seen = [0] * n
+        self._parent = [0] * n
+        self._generation = 0
+
+        # cached plan and the state the game should be in to keep using it
+        self._path = []
+        self._next = 0
+        self._expect = None
+        self.replans = 0
+        self.decisions = 0
+
+    def reset(self):
+        self._path = []
+        self._expect = None
+
+    def engine_action(self, engine):
+        # next Direction for a SnakeEngine (or SnakeGame.engine)
+        bs = engine.block_size
+        head = engine.head
+        food = engine.food
+        head_cell = (head.y // bs) * self.cols + head.x // bs
+        food_cell = (food.y // bs) * self.cols + food.x // bs if food else -1
+        value = self.decide(head_cell, food_cell, len(engine.snake), engine.direction.value,
+                            lambda: [(p.y // bs) * self.cols + p.x // bs for p in engine.snake])
+        return _DIRECTIONS[value]
+
+    def decide(self, head, food, length, direction, body):
+        # Direction value of the next move. body() returns the cells head
+        # first and is only called when a new plan is needed.
+        self.decisions += 1
+        if self._expect == (head, food, length) and self._next < len(self._path):
+            cell = self._path[self._next]
+            self._next += 1
+            self._expect = (cell, food, length)
+            return self._direction(head, cell)
+        self.replans += 1
+        return self._plan(body(), food, direction)
+
+    def _direction(self, head, cell):
+        return self.neighbours[head].index(cell) + 1
+
+    def _plan(self, body, food, direction):
+        head = body[0]
+        length = len(body)
+        free_at = self._free_at
+        for i, cell in enumerate(body):
+            free_at[cell] = length - i
+        try:
+            path = self._search(head, food) if food >= 0 else None
+            if path is not None and self.check_tail and not self._tail_reachable(body, path):
+                path = None
+        finally:
+            for cell in body:
+                free_at[cell] = 0
+
+        if path is None:
+            for i, cell in enumerate(body):
+                free_at[cell] = length - i
+            try:
+                path = self._fallback(body)
+            finally:
+                for cell in body:
+                    free_at[cell] = 0
+        if path is None:
+            # boxed in: nothing to cache, keep going straight
+            self._path = []
+            self._expect = None
+            return direction
+
+        self._path = path
+        self._next = 1
+        self._expect = (path[0], food, length)
+        return self._direction(head, path[0])
+
+    def _search(self, start, goal):
+        # shortest path from start to goal that enters every cell no earlier
+        # than its time-to-free; returns the cells after start, or None
+        self._generation += 1
+        generation = self._generation
+        seen = self._seen
+        parent = self._parent
+        free_at = self._free_at
+        neighbours = self.neighbours
+        seen[start] = generation
+
+        if self.method == "bfs":
+            frontier = deque([(start, 0)])
+            pop = frontier.popleft
+            while frontier:
+                cell, t = pop()
+                t += 1
+                for nxt in neighbours[cell]:
+                    if seen[nxt] != generation and free_at[nxt] <= t:
+                        seen[nxt] = generation
+                        parent[nxt] = cell
+                        if nxt == goal:
+                            return self._unwind(start, goal)
+                        frontier.append((nxt, t))
+            return None
+
+        # wraparound Manhattan distance to the goal, per column and per row
+        xs, ys, cols, rows = self.xs, self.ys, self.cols, self.rows
+        gx, gy = xs[goal], ys[goal]
+        to_x = [min(abs(x - gx), cols - abs(x - gx)) for x in range(cols)]
+        to_y = [min(abs(y - gy), rows - abs(y - gy)) for y in range(rows)]
+
+        frontier = [(to_x[xs[start]] + to_y[ys[start]], 0, start)]
+        push, pop = heapq.heappush, heapq.heappop
+        while frontier:
+            _, t, cell = pop(frontier)
+            if cell == goal:
+                return self._unwind(start, goal)
+            t += 1
+            for nxt in neighbours[cell]:
+                if seen[nxt] != generation and free_at[nxt] <= t:
+                    # marked on push rather than on pop: paths can come out
+                    # a step or two longer, but nothing is expanded twice
+                    seen[nxt] = generation
+                    parent[nxt] = cell
+                    push(frontier, (t + to_x[xs[nxt]] + to_y[ys[nxt]], t, nxt))
+        return None
+
+    def _unwind(self, start, goal):
+        path = [goal]
+        parent = self._parent
+        cell = goal
+        while parent[cell] != start:
+            cell = parent[cell]
+            path.append(cell)
+        path.reverse()
+        return path
+
+    def _tail_reachable(self, body, path, eats=True):
+        # after following `path` (and eating at its end), could the head
+        # still get to the tail? free_at holds the current body and is
+        # restored on return
+        length = len(body) + eats
+        virtual = (path[::-1] + body)[:length]
+        free_at = self._free_at
+        for cell in body:
+            free_at[cell] = 0
+        for i, cell in enumerate(virtual):
+            free_at[cell] = length - i
+        found = self._search(virtual[0], virtual[-1]) is not None
+        for cell in virtual:
+            free_at[cell] = 0
+        for i, cell in enumerate(body):
+            free_at[cell] = len(body) - i
+        return found
+
+    def _fallback(self, body):
+        # a stretch of the Hamiltonian cycle, as far as it is clear of the
+        # body and at most cycle_segment cells, when the snake still has
+        # room after its first step; otherwise the single roomiest move
+        head = body[0]
+        neck = body[1] if len(body) > 1 else -1
+        free_at = self._free_at
+        safe = [cell for cell in self.neighbours[head] if cell != neck and free_at[cell] <= 1]
+        if not safe:
+            return None
+        cycle_next = self.cycle_next
+        cell = cycle_next[head]
+        length = len(body)
+        if cell in safe and self._room(cell, length) >= length:
+            path = [cell]
+            t = 2
+            cell = cycle_next[cell]
+            while len(path) < self.cycle_segment and free_at[cell] <= t:
+                path.append(cell)
+                cell = cycle_next[cell]
+                t += 1
+            if len(path) > 1 and not self._tail_reachable(body, path, eats=False):
+                # the stretch leads somewhere the tail can't be reached from
+                del path[1:]
+            return path
+        return [max(safe, key=lambda cell: self._room(cell, length))]
+
+    def _room(self, start, enough):
+        # cells reachable from start, counting body cells once they are
+        # free; stops counting at `enough`
+        self._generation += 1
+        generation = self._generation
+        seen = self._seen
+        free_at = self._free_at
+        neighbours = self.neighbours
+        seen[start] = generation
+        frontier = deque([(start, 1)])
+        count = 1
+        while frontier:
+            cell, t = frontier.popleft()
+            t += 1
+            for nxt in neighbours[cell]:
+                if seen[nxt] != generation and free_at[nxt] <= t:
+                    seen[nxt] = generation
+                    count += 1
+                    if count >= enough:
+                        return count
+                    frontier.append((nxt, t))
+        return count
+
+
+class BatchPlanner:
+    # one Planner per game of a BatchSnakeEnv
+
+    def __init__(self, env, **kwargs):
+        self.env = env
+        self.planners = [Planner(env.cols, env.rows, **kwargs) for _ in range(env.num_envs)]
+        self.actions = np.zeros(env.num_envs, dtype=np.int32)
+
+    def act(self):
+        # Direction values for env.step, in an array reused across calls
+        env = self.env
+        heads = (env.head_y * env.cols + env.head_x).tolist()
+        foods = env.food.tolist()
+        lengths = env.length.tolist()
+        directions = env.direction.tolist()
+        for n, planner in enumerate(self.planners):
+            self.actions[n] = planner.decide(heads[n], foods[n], lengths[n], directions[n],
+                                             lambda n=n: self._body(n))
+        return self.actions
+
+    def _body(self, n):
+        cells = self.env.snake_cells(n)
+        return (cells[:, 1] * self.env.cols + cells[:, 0]).tolist()
+
+
+if __name__ == '__main__':
+    import argparse
+    import time
+    from snake_engine import SnakeEngine
+    from batch_env import BatchSnakeEnv
+
+    parser = argparse.ArgumentParser(description="Play games with the planner and time its decisions")
+    parser.add_argument("--games", type=int, default=20)
+    parser.add_argument("--max-steps", type=int, default=20000, help="per game")
+    parser.add_argument("--method", default="astar", choices=("astar", "bfs"))
+    parser.add_argument("--envs", type=int, default=64, help="BatchSnakeEnv games for the batch run")
+    parser.add_argument("--batch-steps", type=int, default=500)
+    args = parser.parse_args()
+
+    planner = Planner(method=args.method)
+    scores = []
+    thinking = []
+    for game in range(args.games):
+        engine = SnakeEngine(seed=game)
+        planner.reset()
+        for _ in range(args.max_steps):
+            began = time.perf_counter()
+            action = planner.engine_action(engine)
+            thinking.append(time.perf_counter() - began)
+            if engine.step(action)[0]:
+                break
+        scores.append(engine.score)
+    print(f"engine: mean score {np.mean(scores):.1f} (min {min(scores)}, max {max(scores)}) over {args.games} games")
+    p50, p99 = np.percentile(thinking, [50, 99]) * 1e6
+    print(f"{np.mean(thinking) * 1e6:.1f} us per decision (p50 {p50:.1f}, p99 {p99:.0f}),"
+          f" {planner.replans / planner.decisions:.1%} replanned")
+
+    env = BatchSnakeEnv(args.envs, seed=0)
+    batch = BatchPlanner(env, method=args.method)
+    began = time.perf_counter()
+    for _ in range(args.batch_steps):
+        env.step(batch.act())
+    elapsed = time.perf_counter() - began
+    print(f"batch: {args.envs * args.batch_steps / elapsed:,.0f} env steps/s with {args.envs} envs")
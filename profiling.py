@@ -0,0 +1,309 @@
+import os
+import json
+import time
+import cProfile
+import numpy as np
+
+# Opt-in per-phase timing for SnakeGame. Enabling a FrameProfiler replaces
+# the phase methods on the game's instances (_frame, _handle_events,
+# engine.step, get_ai_input, grid_view.update, _draw_board/_draw_changes,
+# _present and _tick) with timed wrappers; disabling removes them again, so
+# a game that is not being profiled runs the plain methods and pays nothing.
+# encode covers the whole observation: get_ai_input runs ObservationEncoder.
+# play_step and run both go through SnakeGame._frame, and a frame lasts from
+# one _frame call to the next, so the pacing after the work (play_step's
+# tick, run's sleep) counts towards the frame it follows.
+#
+#   profiler = FrameProfiler(game, overlay=True).enable()
+#   profiler.capture("frames.json", frames=120)         # Chrome trace
+#   profiler.capture("frames.prof", frames=120, kind="cprofile")
+#   ...
+#   print(profiler.report())
+#
+# Per-frame totals of every phase go into a ring buffer of the last
+# `capacity` frames; summaries and histograms are computed from it on demand.
+
+PHASES = ("input", "step", "encode", "grid_view", "board", "present", "tick")
+FRAME = "frame"
+
+_HOOKS = (
+    # (phase, attribute path from the game, method)
+    ("input", "", "_handle_events"),
+    ("step", "engine", "step"),
+    ("encode", "", "get_ai_input"),
+    ("grid_view", "grid_view", "update"),
+    ("board", "", "_draw_board"),
+    ("board", "", "_draw_changes"),
+    ("present", "", "_present"),
+    ("tick", "", "_tick"),
+)
+
+
+class FrameProfiler:
+
+    def __init__(self, game, capacity=600, overlay=False, overlay_every=15):
+        self.game = game
+        self.capacity = capacity
+        self.overlay = overlay
+        self.overlay_every = overlay_every
+        self.names = PHASES + (FRAME,)
+        self._index = {name: i for i, name in enumerate(self.names)}
+        # ring buffer of per-frame totals in ns, one row per phase
+        self.history = np.zeros((len(self.names), capacity))
+        self.frames = 0
+        self._totals = [0] * len(self.names)
+        self._frame_began = None
+        self._wrapped = []
+        self._capture = None
+        self._overlay_surface = None
+        self._overlay_font = None
+
+    @property
+    def enabled(self):
+        return bool(self._wrapped)
+
+    def enable(self):
+        if self.enabled:
+            return self
+        for phase, path, name in _HOOKS:
+            target = self.game
+            for part in filter(None, path.split(".")):
+                target = getattr(target, part)
+            if target is not None:
+                # a game with render=False has no grid view
+                self._wrap(target, name, self._index[phase])
+        self._wrap_frame()
+        return self
+
+    def disable(self):
+        self._close_frame()
+        if self._capture is not None:
+            self._finish_capture()
+        for target, name, had_own in reversed(self._wrapped):
+            if had_own is None:
+                delattr(target, name)
+            else:
+                setattr(target, name, had_own)
+        self._wrapped = []
+
+    def _wrap(self, target, name, index):
+        original = getattr(target, name)
+        totals = self._totals
+        clock = time.perf_counter_ns
+
+        def timed(*args, **kwargs):
+            began = clock()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                ended = clock()
+                totals[index] += ended - began
+                if self._capture is not None and self._capture["events"] is not None:
+                    self._capture["events"].append((index, began, ended - began))
+
+        self._remember(target, name)
+        setattr(target, name, timed)
+
+    def _wrap_frame(self):
+        game = self.game
+        original = game._frame
+
+        def timed_frame(*args, **kwargs):
+            self._close_frame()
+            self._begin_frame()
+            return original(*args, **kwargs)
+
+        self._remember(game, "_frame")
+        game._frame = timed_frame
+
+        if self.overlay:
+            present = game._present
+
+            def present_with_overlay(rects=None):
+                rect = self._draw_overlay()
+                if rects is not None and rect is not None:
+                    rects.append(rect)
+                return present(rects)
+
+            self._remember(game, "_present")
+            game._present = present_with_overlay
+
+    def _remember(self, target, name):
+        # an attribute the instance already had of its own is put back on
+        # disable(); otherwise deleting ours uncovers the class method again
+        self._wrapped.append((target, name, vars(target).get(name)))
+
+    def _close_frame(self):
+        # ends the frame the last _frame call opened, if any
+        began = self._frame_began
+        if began is None:
+            return
+        ended = time.perf_counter_ns()
+        frame = self._index[FRAME]
+        self._totals[frame] = ended - began
+        if self._capture is not None and self._capture["events"] is not None:
+            self._capture["events"].append((frame, began, ended - began))
+        self._frame_began = None
+        self._end_frame()
+
+    def _begin_frame(self):
+        self._frame_began = time.perf_counter_ns()
+        capture = self._capture
+        if capture is not None and capture["events"] is None and self.frames >= capture["start"]:
+            capture["events"] = []
+            if capture["kind"] == "cprofile":
+                capture["profile"] = cProfile.Profile()
+                capture["profile"].enable()
+
+    def _end_frame(self):
+        slot = self.frames % self.capacity
+        totals = self._totals
+        for i in range(len(totals)):
+            self.history[i, slot] = totals[i]
+            totals[i] = 0
+        self.frames += 1
+
+        capture = self._capture
+        if capture is not None and capture["events"] is not None:
+            capture["captured"] += 1
+            if capture["captured"] >= capture["frames"]:
+                self._finish_capture()
+
+    def capture(self, path, frames=60, start=None, kind="chrome"):
+        # record `frames` frames starting at frame number `start` (default:
+        # the next one) to a Chrome trace (chrome://tracing, Perfetto) or a
+        # cProfile stats file (python -m pstats, snakeviz)
+        if kind not in ("chrome", "cprofile"):
+            raise ValueError(f"kind must be 'chrome' or 'cprofile', not {kind!r}")
+        if self._capture is not None:
+            raise RuntimeError("a capture is already pending")
+        self._capture = {
+            "path": path, "frames": frames, "kind": kind, "captured": 0, "events": None,
+            "start": self.frames if start is None else start, "profile": None,
+        }
+
+    def _finish_capture(self):
+        capture, self._capture = self._capture, None
+        if capture["events"] is None:
+            return
+        if capture["kind"] == "cprofile":
+            capture["profile"].disable()
+            capture["profile"].dump_stats(capture["path"])
+            return
+        pid = os.getpid()
+        events = [{"name": self.names[index], "ph": "X", "ts": began / 1000, "dur": duration / 1000,
+                   "pid": pid, "tid": 0}
+                  for index, began, duration in capture["events"]]
+        with open(capture["path"], "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+    def recent(self, phase=FRAME):
+        # per-frame ns of one phase over the frames in the ring, oldest first
+        count = min(self.frames, self.capacity)
+        row = self.history[self._index[phase]]
+        if self.frames <= self.capacity:
+            return row[:count]
+        slot = self.frames % self.capacity
+        return np.concatenate([row[slot:], row[:slot]])
+
+    def fps(self):
+        frames = self.recent(FRAME)
+        return 1e9 / frames.mean() if frames.size and frames.mean() > 0 else 0.0
+
+    def summary(self):
+        # ms per frame for every phase over the ring: mean and percentiles
+        stats = {}
+        for name in self.names:
+            values = self.recent(name) / 1e6
+            if values.size == 0:
+                continue
+            p50, p90, p99 = np.percentile(values, [50, 90, 99])
+            stats[name] = {"mean": float(values.mean()), "p50": float(p50), "p90": float(p90),
+                           "p99": float(p99), "max": float(values.max())}
+        return stats
+
+    def histogram(self, phase=FRAME, bins=12):
+        # counts over log-spaced ms bins, for spotting bimodal frame times
+        values = self.recent(phase) / 1e6
+        values = values[values > 0]
+        if values.size == 0:
+            return np.zeros(bins, dtype=int), np.zeros(bins + 1)
+        edges = np.geomspace(values.min(), values.max() * 1.0001, bins + 1)
+        counts, _ = np.histogram(values, edges)
+        return counts, edges
+
+    def report(self):
+        lines = [f"{min(self.frames, self.capacity)} frames, {self.fps():.1f} fps",
+                 f"{'phase':<10} {'mean ms':>9} {'p50':>9} {'p90':>9} {'p99':>9} {'max':>9}"]
+        for name, s in self.summary().items():
+            lines.append(f"{name:<10} {s['mean']:>9.3f} {s['p50']:>9.3f} {s['p90']:>9.3f} {s['p99']:>9.3f}"
+                         f" {s['max']:>9.3f}")
+        return "\n".join(lines)
+
+    def _draw_overlay(self):
+        # FPS and per-phase means in the free strip under the grid view
+        import pygame
+        game = self.game
+        if self._overlay_surface is None or self.frames % self.overlay_every == 0:
+            if self._overlay_font is None:
+                try:
+                    self._overlay_font = pygame.font.Font('arial.ttf', 11)
+                except (FileNotFoundError, OSError):
+                    self._overlay_font = pygame.font.SysFont('arial', 11)
+            means = {name: s["mean"] for name, s in self.summary().items()}
+            lines = [f"{self.fps():5.1f} fps   frame {means.get(FRAME, 0):.2f} ms"]
+            row = []
+            for name in PHASES:
+                row.append(f"{name} {means.get(name, 0):.2f}")
+                if len(row) == 3:
+                    lines.append("   ".join(row))
+                    row = []
+            if row:
+                lines.append("   ".join(row))
+            surface = pygame.Surface((280, 14 * len(lines) + 4))
+            surface.fill((0, 0, 0))
+            for i, line in enumerate(lines):
+                surface.blit(self._overlay_font.render(line, True, (255, 255, 0)), (2, 2 + 14 * i))
+            self._overlay_surface = surface
+        height = game.display.get_height()
+        return game.display.blit(self._overlay_surface, (game.w + 10, height - self._overlay_surface.get_height() - 4))
+
+
+if __name__ == '__main__':
+    import argparse
+    import random
+
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    parser = argparse.ArgumentParser(description="Play a random game and report per-phase frame times")
+    parser.add_argument("--frames", type=int, default=600)
+    parser.add_argument("--fps", type=int, default=0, help="game.SPEED; 0 runs unthrottled")
+    parser.add_argument("--dirty-rects", action="store_true")
+    parser.add_argument("--overlay", action="store_true")
+    parser.add_argument("--trace", help="write a Chrome trace of frames 100-159 here")
+    parser.add_argument("--cprofile", help="write cProfile stats of frames 100-159 here")
+    args = parser.parse_args()
+
+    import game
+    from snake_engine import Direction, OPPOSITE
+
+    game.SPEED = args.fps
+    snake_game = game.SnakeGame(dirty_rects=args.dirty_rects)
+    profiler = FrameProfiler(snake_game, overlay=args.overlay).enable()
+    if args.trace:
+        profiler.capture(args.trace, frames=60, start=100)
+    elif args.cprofile:
+        profiler.capture(args.cprofile, frames=60, start=100, kind="cprofile")
+
+    rng = random.Random(0)
+    snake_game.pressed_direction = snake_game.direction
+    for _ in range(args.frames):
+        if rng.random() < 0.2:
+            choice = rng.choice(list(Direction))
+            if choice != OPPOSITE[snake_game.direction]:
+                snake_game.pressed_direction = choice
+        game_over, _ = snake_game.play_step()
+        if game_over:
+            snake_game.engine.reset()
+            snake_game.pressed_direction = snake_game.direction
+    profiler.disable()
+    print(profiler.report())
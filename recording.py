@@ -0,0 +1,260 @@
+import os
+import random
+import struct
+from collections import OrderedDict
+import numpy as np
+from snake_engine import SnakeEngine, Direction, Point, DELTAS
+
+# Compact episode recordings. An episode is stored as its seed, board size,
+# initial body and direction, 2 bits per step for the direction moved and
+# one record per food spawn; everything else is rebuilt on demand.
+#
+# File layout (little-endian):
+#   b'SNAKEREC' u16 version, then episodes back to back, each:
+#   header      seed u64, w u16, h u16, block_size u16, steps u32, foods u32,
+#               direction u8, flags u8, initial head/body/tail cells 6 x u16
+#   actions     ceil(steps / 4) bytes, Direction.value - 1 in 2-bit pairs,
+#               lowest bits first
+#   foods       foods x (step u32, x u16, y u16), step 0 is the initial food
+#               and x = y = 0xFFFF means no food (full board)
+
+MAGIC = b'SNAKEREC'
+VERSION = 1
+_FILE_HEADER = struct.Struct('<8sH')
+_EPISODE_HEADER = struct.Struct('<QHHHIIBB6H')
+_FOOD_DTYPE = np.dtype([('step', '<u4'), ('x', '<u2'), ('y', '<u2')])
+NO_FOOD = 0xFFFF
+FLAG_GAME_OVER = 1
+
+# indexed by Direction.value - 1
+_DX, _DY = np.array([DELTAS[Direction(value)] for value in range(1, 5)]).T
+
+
+def pack_actions(codes):
+    codes = np.asarray(codes, dtype=np.uint8)
+    padded = np.zeros(-(-len(codes) // 4) * 4, dtype=np.uint8)
+    padded[:len(codes)] = codes
+    quads = padded.reshape(-1, 4)
+    return quads[:, 0] | (quads[:, 1] << 2) | (quads[:, 2] << 4) | (quads[:, 3] << 6)
+
+
+def unpack_actions(packed, steps):
+    packed = np.asarray(packed, dtype=np.uint8)
+    codes = np.stack([packed & 3, (packed >> 2) & 3, (packed >> 4) & 3, packed >> 6], axis=1)
+    return codes.reshape(-1)[:steps]
+
+
+class EpisodeRecorder:
+    # Drives a SnakeEngine and logs what is needed to rebuild every step.
+
+    def __init__(self, engine=None, **engine_kwargs):
+        self.engine = engine if engine is not None else SnakeEngine(**engine_kwargs)
+        self.reset()
+
+    def reset(self, seed=None):
+        if seed is None:
+            seed = random.getrandbits(63)
+        self.seed = seed
+        self.engine.reset(seed)
+        self.game_over = False
+        self._initial_direction = self.engine.direction
+        bs = self.engine.block_size
+        self._initial_cells = [c for pt in self.engine.snake for c in (pt.x // bs, pt.y // bs)]
+        self._codes = bytearray()
+        self._foods = [(0,) + self._food_cell()]
+
+    def _food_cell(self):
+        food = self.engine.food
+        if food is None:
+            return NO_FOOD, NO_FOOD
+        return food.x // self.engine.block_size, food.y // self.engine.block_size
+
+    def step(self, action=None):
+        food = self.engine.food
+        game_over, score = self.engine.step(action)
+        self._codes.append(self.engine.direction.value - 1)
+        if not game_over and self.engine.food != food:
+            self._foods.append((len(self._codes),) + self._food_cell())
+        self.game_over = game_over
+        return game_over, score
+
+    def to_bytes(self):
+        engine = self.engine
+        header = _EPISODE_HEADER.pack(
+            self.seed, engine.w, engine.h, engine.block_size, len(self._codes), len(self._foods),
+            self._initial_direction.value, FLAG_GAME_OVER if self.game_over else 0, *self._initial_cells)
+        foods = np.array(self._foods, dtype=_FOOD_DTYPE)
+        return header + pack_actions(self._codes).tobytes() + foods.tobytes()
+
+
+class RecordingWriter:
+
+    def __init__(self, path):
+        is_new = not os.path.exists(path) or os.path.getsize(path) == 0
+        self.file = open(path, 'ab')
+        if is_new:
+            self.file.write(_FILE_HEADER.pack(MAGIC, VERSION))
+
+    def write(self, episode):
+        # an EpisodeRecorder or the bytes of one episode
+        if isinstance(episode, EpisodeRecorder):
+            episode = episode.to_bytes()
+        self.file.write(episode)
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class Episode:
+    # One recorded episode, parsed from a buffer (bytes or a memmap slice).
+    # States are rebuilt from the head trail: after t steps the snake is the
+    # last length(t) head positions, and length(t) is 3 plus the number of
+    # food spawns up to t.
+
+    def __init__(self, buffer, offset=0):
+        if not isinstance(buffer, np.ndarray):
+            buffer = memoryview(buffer).cast('B')
+        (self.seed, self.w, self.h, self.block_size, self.steps, num_foods, direction, flags,
+         *cells) = _EPISODE_HEADER.unpack_from(buffer, offset)
+        self.initial_direction = Direction(direction)
+        self.game_over = bool(flags & FLAG_GAME_OVER)
+        self.initial_cells = np.array(cells).reshape(3, 2)
+
+        start = offset + _EPISODE_HEADER.size
+        packed_size = -(-self.steps // 4)
+        self._packed = np.frombuffer(buffer, dtype=np.uint8, count=packed_size, offset=start)
+        self.foods = np.frombuffer(buffer, dtype=_FOOD_DTYPE, count=num_foods, offset=start + packed_size)
+        self.size = _EPISODE_HEADER.size + packed_size + num_foods * _FOOD_DTYPE.itemsize
+        self._codes = None
+        self._trail = None
+
+    @property
+    def num_states(self):
+        # the state after the fatal step is not a valid game state
+        return self.steps if self.game_over else self.steps + 1
+
+    def codes(self):
+        if self._codes is None:
+            self._codes = unpack_actions(self._packed, self.steps)
+        return self._codes
+
+    def actions(self):
+        # Direction values moved at each step
+        return self.codes() + 1
+
+    def _decode(self):
+        if self._trail is None:
+            cols = (self.w - self.block_size) // self.block_size + 1
+            rows = (self.h - self.block_size) // self.block_size + 1
+            codes = self.codes()
+            head_x, head_y = self.initial_cells[0]
+            xs = (head_x + np.cumsum(_DX[codes])) % cols
+            ys = (head_y + np.cumsum(_DY[codes])) % rows
+            # tail, body, head of the initial snake, then every new head
+            initial = self.initial_cells[::-1]
+            self._trail = np.concatenate([initial, np.stack([xs, ys], axis=1)]).astype(np.int32)
+        return self._trail
+
+    def cells_at(self, t):
+        # (x, y) cells of the snake after t steps, head first
+        trail = self._decode()
+        length = 3 + int(np.count_nonzero((self.foods['step'] >= 1) & (self.foods['step'] <= t)))
+        return trail[t + 2 - np.arange(length)]
+
+    def food_at(self, t):
+        index = int(np.searchsorted(self.foods['step'], t, side='right')) - 1
+        x, y = int(self.foods['x'][index]), int(self.foods['y'][index])
+        if x == NO_FOOD:
+            return None
+        return Point(x * self.block_size, y * self.block_size)
+
+    def direction_at(self, t):
+        if t == 0:
+            return self.initial_direction
+        return Direction(int(self.codes()[t - 1]) + 1)
+
+    def state_at(self, t):
+        # (snake, food, direction) after t steps, as SnakeEngine holds them
+        if not 0 <= t < self.num_states:
+            raise IndexError(f"step {t} out of range for an episode with {self.num_states} states")
+        snake = [Point(int(x) * self.block_size, int(y) * self.block_size) for x, y in self.cells_at(t)]
+        return snake, self.food_at(t), self.direction_at(t)
+
+    def replay(self, t=None):
+        # a live SnakeEngine stepped to t (default: the end) with the
+        # recorded food spawns, e.g. to continue the game from there
+        t = self.steps if t is None else t
+        engine = SnakeEngine(self.w, self.h, self.block_size, seed=self.seed)
+        spawns = {int(s): (int(x), int(y)) for s, x, y in self.foods}
+        for i, code in enumerate(self.codes()[:t], start=1):
+            engine.step(Direction(int(code) + 1))
+            if i in spawns:
+                x, y = spawns[i]
+                engine.food = None if x == NO_FOOD else Point(x * self.block_size, y * self.block_size)
+        return engine
+
+
+class ReplayDataset:
+    # Random access to every state of every episode in a recording file,
+    # through a read-only memmap. Only episode headers are read up front;
+    # decoded head trails are kept for the most recently used episodes.
+
+    def __init__(self, path, cache_size=256):
+        self.data = np.memmap(path, dtype=np.uint8, mode='r')
+        magic, version = _FILE_HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a snake recording")
+        if version != VERSION:
+            raise ValueError(f"unsupported recording version {version}")
+
+        offsets = []
+        offset = _FILE_HEADER.size
+        while offset < len(self.data):
+            offsets.append(offset)
+            offset += Episode(self.data, offset).size
+        self.offsets = np.array(offsets, dtype=np.int64)
+        states = [Episode(self.data, o).num_states for o in offsets]
+        self.first_state = np.concatenate([[0], np.cumsum(states)]).astype(np.int64)
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+
+    def __len__(self):
+        return int(self.first_state[-1])
+
+    @property
+    def num_episodes(self):
+        return len(self.offsets)
+
+    def episode(self, index):
+        episode = self._cache.get(index)
+        if episode is None:
+            episode = Episode(self.data, int(self.offsets[index]))
+            self._cache[index] = episode
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        else:
+            self._cache.move_to_end(index)
+        return episode
+
+    def locate(self, index):
+        # global state index -> (episode, step)
+        episode = int(np.searchsorted(self.first_state, index, side='right')) - 1
+        return episode, int(index - self.first_state[episode])
+
+    def state(self, index):
+        episode, t = self.locate(index)
+        return self.episode(episode).state_at(t)
+
+    def sample(self, batch_size, rng=None):
+        rng = np.random.default_rng(rng)
+        return [self.state(int(i)) for i in rng.integers(0, len(self), size=batch_size)]
+
+    def encode(self, states, grid_processor):
+        # get_normalized_input_batch over a list of (snake, food, direction)
+        return grid_processor.get_normalized_input_batch(*grid_processor.batch_arrays(states))
@@ -0,0 +1,254 @@
+import time
+import weakref
+import multiprocessing as mp
+from multiprocessing import shared_memory
+import numpy as np
+from batch_env import BatchSnakeEnv
+from snake_engine import BLOCK_SIZE
+from config import BoardConfig
+
+# Experience generation across processes. Environments are split into one
+# contiguous shard per worker; every worker steps its shard with a
+# BatchSnakeEnv and writes observations, rewards and dones straight into
+# shared-memory arrays, so only tiny command messages go through the pipes.
+#
+#   with RolloutRunner(num_envs=1024, num_workers=4, seed=0) as runner:
+#       obs = runner.reset()
+#       obs, rewards, dones = runner.step(actions)
+#
+# The returned arrays are views of shared memory and are overwritten by the
+# next step; copy what you want to keep. They stay readable after the runner
+# is closed: close() only unlinks the blocks, and each block is unmapped once
+# its array and every view of it are gone.
+
+
+def _buffer_specs(num_envs, view_size):
+    return {
+        "obs": ((num_envs, 2, view_size, view_size), np.int16),
+        "actions": ((num_envs,), np.int8),
+        "rewards": ((num_envs,), np.float32),
+        "dones": ((num_envs,), np.bool_),
+        "scores": ((num_envs,), np.int32),
+    }
+
+
+def shared_arrays(specs):
+    # new shared-memory blocks and arrays over them, {key: (shape, dtype)}
+    # -> ({key: block}, {key: array}). numpy keeps no buffer export on the
+    # mapping, so closing a block would pull it from under any view still
+    # alive; each block is closed by a finalizer on its array instead, which
+    # every view keeps alive. Callers only unlink.
+    blocks = {}
+    arrays = {}
+    for key, (shape, dtype) in specs.items():
+        nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        block = shared_memory.SharedMemory(create=True, size=max(nbytes, 1))
+        array = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+        weakref.finalize(array, block.close)
+        blocks[key] = block
+        arrays[key] = array
+    return blocks, arrays
+
+
+def _attach(names, specs):
+    blocks = {}
+    arrays = {}
+    for key, (shape, dtype) in specs.items():
+        # workers are children of the runner and report to its resource
+        # tracker, which forgets the blocks when the runner unlinks them
+        block = shared_memory.SharedMemory(name=names[key])
+        blocks[key] = block
+        arrays[key] = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+    return blocks, arrays
+
+
+def _worker(conn, names, specs, start, stop, config, seed):
+    blocks, arrays = _attach(names, specs)
+    obs = arrays["obs"][start:stop]
+    # the env encodes its observations straight into the shared slice
+    env = BatchSnakeEnv(stop - start, seed=seed, config=config, obs=obs)
+    actions = arrays["actions"][start:stop]
+    rewards = arrays["rewards"][start:stop]
+    dones = arrays["dones"][start:stop]
+    scores = arrays["scores"][start:stop]
+    steps = 0
+    busy = 0.0
+
+    try:
+        while True:
+            command = conn.recv()
+            began = time.perf_counter()
+            if command == "step":
+                _, rewards[:], dones[:] = env.step(actions)
+                # score of the finished episode for envs that just reset
+                scores[:] = np.where(dones, env.final_score, env.score)
+                steps += stop - start
+            elif command == "reset":
+                env.reset()
+                rewards[:] = 0
+                dones[:] = False
+                scores[:] = 0
+                # rates are counted from the last reset, as on the runner
+                steps = 0
+                busy = 0.0
+                began = time.perf_counter()
+            elif command == "close":
+                break
+            busy += time.perf_counter() - began
+            conn.send((steps, busy))
+    finally:
+        del env, obs, actions, rewards, dones, scores, arrays
+        for block in blocks.values():
+            block.close()
+        conn.close()
+
+
+class RolloutRunner:
+
+    def __init__(self, num_envs, num_workers=None, w=500, h=500, block_size=BLOCK_SIZE, seed=None,
+                 start_method=None, view_radius=None, config=None):
+        if num_workers is None:
+            num_workers = mp.cpu_count()
+        num_workers = max(1, min(num_workers, num_envs))
+        self.num_envs = num_envs
+        self.num_workers = num_workers
+        if config is None:
+            config = BoardConfig(w, h, block_size, view_radius)
+        self.config = config
+        self.view_size = config.view_size
+
+        specs = _buffer_specs(num_envs, self.view_size)
+        self._blocks, self._arrays = shared_arrays(specs)
+        names = {key: block.name for key, block in self._blocks.items()}
+
+        # independent, reproducible food streams per worker
+        seeds = np.random.SeedSequence(seed).spawn(num_workers)
+        bounds = [int(b) for b in np.linspace(0, num_envs, num_workers + 1)]
+        self.shards = list(zip(bounds[:-1], bounds[1:]))
+
+        ctx = mp.get_context(start_method)
+        self._conns = []
+        self._processes = []
+        for (start, stop), worker_seed in zip(self.shards, seeds):
+            parent_conn, child_conn = ctx.Pipe()
+            process = ctx.Process(target=_worker, daemon=True,
+                                  args=(child_conn, names, specs, start, stop, config, worker_seed))
+            process.start()
+            child_conn.close()
+            self._conns.append(parent_conn)
+            self._processes.append(process)
+
+        self._waiting = False
+        self._worker_stats = [(0, 0.0)] * num_workers
+        self._started = time.perf_counter()
+        self._closed = False
+
+    @property
+    def obs(self):
+        return self._arrays["obs"]
+
+    @property
+    def scores(self):
+        return self._arrays["scores"]
+
+    def _send(self, command):
+        if self._waiting:
+            raise RuntimeError("step_wait() must be called before sending another command")
+        for conn in self._conns:
+            conn.send(command)
+        self._waiting = True
+
+    def _wait(self):
+        self._worker_stats = [conn.recv() for conn in self._conns]
+        self._waiting = False
+
+    def reset(self):
+        self._send("reset")
+        self._wait()
+        self._started = time.perf_counter()
+        return self._arrays["obs"]
+
+    def step_async(self, actions):
+        # actions are Direction values per env, 0 keeps the current heading
+        self._arrays["actions"][:] = actions
+        self._send("step")
+
+    def step_wait(self):
+        self._wait()
+        return self._arrays["obs"], self._arrays["rewards"], self._arrays["dones"]
+
+    def step(self, actions):
+        self.step_async(actions)
+        return self.step_wait()
+
+    def worker_stats(self):
+        # env steps per second of busy time for each worker, plus the
+        # overall rate since the last reset
+        elapsed = time.perf_counter() - self._started
+        stats = []
+        for (start, stop), (steps, busy) in zip(self.shards, self._worker_stats):
+            stats.append({
+                "envs": stop - start,
+                "steps": steps,
+                "busy_seconds": busy,
+                "steps_per_sec": steps / busy if busy else 0.0,
+                "wall_steps_per_sec": steps / elapsed if elapsed else 0.0,
+            })
+        return stats
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        if self._waiting:
+            self._wait()
+        for conn in self._conns:
+            try:
+                conn.send("close")
+            except (BrokenPipeError, OSError):
+                pass
+        for process in self._processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        for conn in self._conns:
+            conn.close()
+        # the mappings go with the last views of the arrays
+        self._arrays.clear()
+        for block in self._blocks.values():
+            block.unlink()
+        self._blocks.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Measure rollout throughput with random actions")
+    parser.add_argument("--envs", type=int, default=1024)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--steps", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    with RolloutRunner(args.envs, args.workers, seed=args.seed) as runner:
+        runner.reset()
+        began = time.perf_counter()
+        for _ in range(args.steps):
+            runner.step(rng.integers(0, 5, size=args.envs))
+        elapsed = time.perf_counter() - began
+        for i, stats in enumerate(runner.worker_stats()):
+            print(f"worker {i}: {stats['envs']} envs, {stats['steps_per_sec']:.0f} steps/s")
+        print(f"total: {args.envs * args.steps / elapsed:.0f} steps/s")
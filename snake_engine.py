@@ -0,0 +1,159 @@
+import random
+from enum import Enum
+from collections import namedtuple, deque
+
+# Headless snake rules: no pygame, no clock. SnakeGame in game.py is the
+# optional pygame front end that renders one of these.
+
+class Direction(Enum):
+    RIGHT = 1
+    LEFT = 2
+    UP = 3
+    DOWN = 4
+
+Point = namedtuple('Point', 'x, y')
+
+BLOCK_SIZE = 20
+
+OPPOSITE = {
+    Direction.RIGHT: Direction.LEFT,
+    Direction.LEFT: Direction.RIGHT,
+    Direction.UP: Direction.DOWN,
+    Direction.DOWN: Direction.UP,
+}
+
+DELTAS = {
+    Direction.RIGHT: (1, 0),
+    Direction.LEFT: (-1, 0),
+    Direction.UP: (0, -1),
+    Direction.DOWN: (0, 1),
+}
+
+
+class SnakeEngine:
+
+    def __init__(self, w=500, h=500, block_size=BLOCK_SIZE, seed=None):
+        self.w = w
+        self.h = h
+        self.block_size = block_size
+        self.cols = (w - block_size) // block_size + 1
+        self.rows = (h - block_size) // block_size + 1
+        self.rng = random.Random(seed)
+        # optional grid_processor.ObservationEncoder kept in sync with the body
+        self.encoder = None
+        # bumped on every reset and step, for caches keyed on the state
+        self.version = 0
+        self.reset()
+
+    def attach_encoder(self, encoder):
+        self.encoder = encoder
+        encoder.reset(self.snake)
+
+    def reset(self, seed=None):
+        if seed is not None:
+            self.rng.seed(seed)
+
+        self.direction = Direction.RIGHT
+
+        start_x = (self.w // 2) // self.block_size * self.block_size
+        start_y = (self.h // 2) // self.block_size * self.block_size
+        self.head = Point(start_x, start_y)
+        self.snake = deque([self.head,
+                            Point(self.head.x-self.block_size, self.head.y),
+                            Point(self.head.x-(2*self.block_size), self.head.y)])
+
+        # occupancy counts per cell plus an index of the free cells, so that
+        # collision checks and food placement never scan the body
+        num_cells = self.cols * self.rows
+        self._occupancy = [0] * num_cells
+        self._free = list(range(num_cells))
+        self._free_pos = list(range(num_cells))
+        for pt in self.snake:
+            self._occupy(self._cell(pt))
+
+        self.score = 0
+        self.frame_iteration = 0
+        self.version += 1
+        self.food = None
+        self._place_food()
+
+        if self.encoder is not None:
+            self.encoder.reset(self.snake)
+
+    def step(self, action=None):
+        # action is a Direction; None or a reversal keeps the current heading
+        if action is not None and action != OPPOSITE[self.direction]:
+            self.direction = action
+
+        self._move(self.direction)
+        collision = self._is_collision()
+        self.snake.appendleft(self.head)
+        self._occupy(self._cell(self.head))
+        self.frame_iteration += 1
+        self.version += 1
+        if self.encoder is not None:
+            self.encoder.push_head(self.head)
+
+        if collision:
+            return True, self.score
+
+        if self.head == self.food:
+            self.score += 1
+            self._place_food()
+        else:
+            self._vacate(self._cell(self.snake.pop()))
+            if self.encoder is not None:
+                self.encoder.pop_tail()
+
+        return False, self.score
+
+    def _cell(self, pt):
+        return (pt.y // self.block_size) * self.cols + pt.x // self.block_size
+
+    def _occupy(self, cell):
+        self._occupancy[cell] += 1
+        if self._occupancy[cell] == 1:
+            # swap-remove from the free index
+            pos = self._free_pos[cell]
+            last = self._free.pop()
+            if last != cell:
+                self._free[pos] = last
+                self._free_pos[last] = pos
+            self._free_pos[cell] = -1
+
+    def _vacate(self, cell):
+        self._occupancy[cell] -= 1
+        if self._occupancy[cell] == 0:
+            self._free_pos[cell] = len(self._free)
+            self._free.append(cell)
+
+    def _place_food(self):
+        if not self._free:
+            # the snake fills the board
+            self.food = None
+            return
+        cell = self._free[self.rng.randrange(len(self._free))]
+        self.food = Point(cell % self.cols * self.block_size, cell // self.cols * self.block_size)
+
+    def _is_collision(self):
+        # called with the new head before it joins the body; the tail cell
+        # is about to be vacated so moving onto it is allowed
+        if self.head == self.snake[-1]:
+            return False
+        return self._occupancy[self._cell(self.head)] > 0
+
+    def _move(self, direction):
+        dx, dy = DELTAS[direction]
+        x = int(self.head.x) + dx * self.block_size
+        y = int(self.head.y) + dy * self.block_size
+
+        if x < 0:
+            x = self.w - self.block_size
+        elif x > self.w - self.block_size:
+            x = 0
+        if y < 0:
+            y = self.h - self.block_size
+        elif y > self.h - self.block_size:
+            y = 0
+
+        self.head = Point(x, y)
@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+from grid_processor import REVERSE, NUM_ACTIONS, to_absolute
+
+torch = pytest.importorskip("torch")
+from agent import SnakePolicy, BatchAgent, benchmark_latency  # noqa: E402
+
+
+def observations(batch, grid_size, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.integers(-1, 10, size=(batch, 2, grid_size, grid_size)).astype(np.int16)
+
+
+def test_stack_takes_dicts_and_arrays():
+    agent = BatchAgent(SnakePolicy(7), grid_size=7)
+    obs = observations(5, 7)
+    dicts = [{"snake_grid": o[0].astype(np.int64), "food_grid": o[1].astype(np.int64)} for o in obs]
+    stacked = agent.stack(obs).clone()
+    assert stacked.dtype == torch.float32 and stacked.shape == (5, 2, 7, 7)
+    np.testing.assert_array_equal(stacked.numpy(), obs)
+    np.testing.assert_array_equal(agent.stack(dicts).numpy(), obs)
+    # a bigger batch grows the reused buffer
+    np.testing.assert_array_equal(agent.stack(observations(9, 7, seed=1)).numpy(), observations(9, 7, seed=1))
+
+
+def test_reverse_is_masked():
+    torch.manual_seed(0)
+    agent = BatchAgent(SnakePolicy(7), grid_size=7)
+    logits = agent.logits(observations(64, 7))
+    assert logits.shape == (64, NUM_ACTIONS)
+    assert torch.isinf(logits[:, REVERSE]).all()
+    assert torch.isfinite(logits[:, [a for a in range(NUM_ACTIONS) if a != REVERSE]]).all()
+    assert (agent.act(observations(64, 7), greedy=False) != REVERSE).all()
+
+
+def test_act_turns_relative_actions_into_directions():
+    torch.manual_seed(0)
+    agent = BatchAgent(SnakePolicy(7), grid_size=7)
+    obs = observations(32, 7)
+    directions = np.random.default_rng(2).integers(1, 5, size=32)
+    relative = agent.act(obs)
+    assert (relative != REVERSE).all()
+    np.testing.assert_array_equal(agent.act(obs, directions), to_absolute(relative, directions))
+
+
+def test_benchmark_latency_runs():
+    rows = benchmark_latency(batch_sizes=(1, 4), repeats=2, grid_size=7)
+    assert [row["batch"] for row in rows] == [1, 4]
+    assert all(row["ms_per_call"] > 0 for row in rows)
@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+from snake_engine import SnakeEngine, Direction, Point
+from batch_env import BatchSnakeEnv
+
+
+def food_point(env, n):
+    food = int(env.food[n])
+    if food < 0:
+        return None
+    return Point(food % env.cols * env.block_size, food // env.cols * env.block_size)
+
+
+@pytest.mark.parametrize("grid_size", [7, 25])
+def test_steps_match_engine_and_scalar_observations(grid_size):
+    # every game of the batch against a SnakeEngine playing the same moves;
+    # the engines are handed the env's food, which comes from another rng
+    num_envs = 8
+    env = BatchSnakeEnv(num_envs, grid_size * 20, grid_size * 20, seed=0)
+    engines = [SnakeEngine(grid_size * 20, grid_size * 20) for _ in range(num_envs)]
+    for n, engine in enumerate(engines):
+        engine.food = food_point(env, n)
+    gp = env.grid_processor
+    rng = np.random.default_rng(0)
+    finished = 0
+    for _ in range(400):
+        actions = rng.integers(0, 5, size=num_envs)
+        obs, rewards, dones = env.step(actions)
+        for n, engine in enumerate(engines):
+            score = engine.score
+            game_over, _ = engine.step(Direction(int(actions[n])) if actions[n] else None)
+            assert dones[n] == game_over
+            if game_over:
+                assert env.final_score[n] == score
+                assert rewards[n] == -1
+                engine.reset()
+                finished += 1
+            else:
+                assert rewards[n] == engine.score - score
+            cells = env.snake_cells(n) * env.block_size
+            assert [tuple(c) for c in cells.tolist()] == [tuple(p) for p in engine.snake]
+            assert env.direction[n] == engine.direction.value
+            engine.food = food_point(env, n)
+            ref = gp.get_normalized_input(list(engine.snake), engine.food, engine.direction)
+            np.testing.assert_array_equal(obs[n, 0], ref["snake_grid"])
+            np.testing.assert_array_equal(obs[n, 1], ref["food_grid"])
+    assert finished > 0
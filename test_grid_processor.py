@@ -0,0 +1,180 @@
+import random
+import numpy as np
+import pytest
+from snake_engine import SnakeEngine, Direction, DELTAS
+from grid_processor import GridProcessor, ObservationEncoder, ENCODINGS, FORWARD, TURN_RIGHT, REVERSE, TURN_LEFT, to_absolute, to_relative
+
+
+def reference_input(gp, snake, food, direction):
+    # the original get_normalized_input: world grids, rotate_grid, then
+    # center_grid on the rotated head; food through the wrapped offset and
+    # rotate_vector
+    g = gp.grid_size
+    snake_grid = gp.create_snake_grid(snake)
+    rotated = gp.rotate_grid(snake_grid, direction)
+    head_y, head_x = [int(v[0]) for v in np.where(rotated == 1)]
+    centered_snake = gp.center_grid(rotated, (head_x, head_y))
+
+    centered_food = np.full((g, g), -1)
+    food_pos = np.where(gp.create_food_grid(food) == 1)
+    if len(food_pos[0]) > 0:
+        world_head_y, world_head_x = [int(v[0]) for v in np.where(snake_grid == 1)]
+        half_grid = g // 2
+        dx = int(food_pos[1][0]) - world_head_x
+        dy = int(food_pos[0][0]) - world_head_y
+        dx = dx - g if dx > half_grid else dx + g if dx < -half_grid else dx
+        dy = dy - g if dy > half_grid else dy + g if dy < -half_grid else dy
+        rotated_dx, rotated_dy = gp.rotate_vector(dx, dy, direction)
+        x, y = half_grid + rotated_dx, half_grid + rotated_dy
+        if 0 <= x < g and 0 <= y < g:
+            centered_food[y][x] = 1
+    return {"snake_grid": centered_snake, "food_grid": centered_food}
+
+
+def play_states(grid_size, count=500, seed=0, rows=None):
+    # (snake, food, direction) of random games, game-over states left out
+    engine = SnakeEngine(grid_size * 20, (rows or grid_size) * 20, seed=seed)
+    rng = random.Random(seed)
+    states = []
+    while len(states) < count:
+        direction = rng.choice(list(Direction)) if rng.random() < 0.3 else engine.direction
+        game_over, _ = engine.step(direction)
+        if game_over:
+            engine.reset()
+        else:
+            states.append((list(engine.snake), engine.food, engine.direction))
+    return states
+
+
+def rolled_crop(cols, rows, radius, snake, food, direction):
+    # head-centred crop of a board of any shape: roll the world grids so the
+    # head sits at the centre, cut out the square and turn it as rotate_grid
+    # does; the crop fits across the board, so the roll never hides a cell
+    snake_grid = np.full((rows, cols), -1)
+    for i, segment in enumerate(snake):
+        snake_grid[segment.y // 20 % rows, segment.x // 20 % cols] = i + 1
+    food_grid = np.full((rows, cols), -1)
+    if food:
+        food_grid[food.y // 20, food.x // 20] = 1
+    head_x, head_y = snake[0].x // 20 % cols, snake[0].y // 20 % rows
+    k = {Direction.UP: 0, Direction.RIGHT: 1, Direction.DOWN: 2, Direction.LEFT: 3}[direction]
+    views = {}
+    for key, grid in (("snake_grid", snake_grid), ("food_grid", food_grid)):
+        rolled = np.roll(grid, (rows // 2 - head_y, cols // 2 - head_x), axis=(0, 1))
+        crop = rolled[rows // 2 - radius:rows // 2 + radius + 1, cols // 2 - radius:cols // 2 + radius + 1]
+        views[key] = np.rot90(crop, k)
+    return views
+
+
+def batch_item(batch, b):
+    return {key: grids[b] for key, grids in batch.items()}
+
+
+@pytest.mark.parametrize("grid_size", [6, 7, 25])
+def test_batch_matches_reference(grid_size):
+    gp = GridProcessor(grid_size=grid_size)
+    states = play_states(grid_size)
+    batch = gp.get_normalized_input_batch(*gp.batch_arrays(states))
+    for b, state in enumerate(states):
+        ref = reference_input(gp, *state)
+        np.testing.assert_array_equal(batch["snake_grid"][b], ref["snake_grid"])
+        np.testing.assert_array_equal(batch["food_grid"][b], ref["food_grid"])
+
+
+@pytest.mark.parametrize("grid_size", [6, 7, 25])
+def test_scalar_and_encodings_match_reference(grid_size):
+    gp = GridProcessor(grid_size=grid_size)
+    processors = [GridProcessor(grid_size, encoding=encoding) for encoding in ENCODINGS]
+    for state in play_states(grid_size, count=200, seed=1):
+        ref = reference_input(gp, *state)
+        outputs = [gp.get_normalized_input(*state)]
+        outputs += [p.decode(p.get_encoded_input(*state)) for p in processors]
+        for out in outputs:
+            np.testing.assert_array_equal(out["snake_grid"], ref["snake_grid"])
+            np.testing.assert_array_equal(out["food_grid"], ref["food_grid"])
+
+
+@pytest.mark.parametrize("grid_size, radius", [(7, 2), (25, 5), (24, 4)])
+def test_cropped_view_is_centre_of_reference(grid_size, radius):
+    gp = GridProcessor(grid_size=grid_size)
+    cropped = GridProcessor(grid_size=grid_size, view_radius=radius)
+    states = play_states(grid_size, count=200, seed=2)
+    batch = cropped.get_normalized_input_batch(*cropped.batch_arrays(states))
+    centre = slice(grid_size // 2 - radius, grid_size // 2 + radius + 1)
+    for b, state in enumerate(states):
+        ref = reference_input(gp, *state)
+        for key in ("snake_grid", "food_grid"):
+            np.testing.assert_array_equal(batch[key][b], ref[key][centre, centre])
+
+
+@pytest.mark.parametrize("grid_size", [6, 7])
+def test_relative_actions_follow_the_view(grid_size):
+    # the absolute move of every relative action lands on the view cell
+    # next to the head in that action's direction
+    gp = GridProcessor(grid_size=grid_size)
+    center = grid_size // 2
+    view_steps = {FORWARD: (0, -1), TURN_RIGHT: (1, 0), REVERSE: (0, 1), TURN_LEFT: (-1, 0)}
+    for direction in Direction:
+        for head_y in range(grid_size):
+            for head_x in range(grid_size):
+                view = gp.view_index(direction, head_x, head_y).reshape(grid_size, grid_size)
+                for action, (vx, vy) in view_steps.items():
+                    moved = Direction(int(to_absolute(action, direction.value)))
+                    dx, dy = DELTAS[moved]
+                    cell = ((head_y + dy) % grid_size) * grid_size + (head_x + dx) % grid_size
+                    assert view[center + vy, center + vx] == cell
+                    assert to_relative(moved.value, direction) == action
+
+    directions = np.array([d.value for d in Direction] * 4)
+    actions = np.repeat(np.arange(4), 4)
+    np.testing.assert_array_equal(to_relative(to_absolute(actions, directions), directions), actions)
+    np.testing.assert_array_equal(to_absolute(np.full(4, REVERSE), list(Direction)),
+                                  [Direction.LEFT.value, Direction.RIGHT.value, Direction.DOWN.value, Direction.UP.value])
+
+
+@pytest.mark.parametrize("cols, rows, radius", [(30, 25, 12), (9, 6, 2), (8, 11, 3)])
+def test_rectangular_boards_crop_like_the_rolled_board(cols, rows, radius):
+    gp = GridProcessor(cols, view_radius=radius, rows=rows)
+    states = play_states(cols, count=300, seed=3, rows=rows)
+    batch = gp.get_normalized_input_batch(*gp.batch_arrays(states))
+    encoder = ObservationEncoder(gp)
+    for b, state in enumerate(states):
+        ref = rolled_crop(cols, rows, radius, *state)
+        encoder.reset(state[0])
+        for out in (batch_item(batch, b), gp.get_normalized_input(*state), encoder.encode(*state[1:])):
+            np.testing.assert_array_equal(out["snake_grid"], ref["snake_grid"])
+            np.testing.assert_array_equal(out["food_grid"], ref["food_grid"])
+
+
+def test_whole_board_view_needs_a_square_board():
+    with pytest.raises(ValueError):
+        GridProcessor(30, rows=25)
+
+
+@pytest.mark.parametrize("cols, rows, radius", [(6, 6, None), (7, 7, None), (25, 25, None), (9, 6, 2)])
+def test_incremental_encoder_matches_scalar_path(cols, rows, radius):
+    # the encoder fed by SnakeEngine.step through push_head/pop_tail, on
+    # every state including the game-over ones
+    gp = GridProcessor(cols, view_radius=radius, rows=rows)
+    engine = SnakeEngine(cols * 20, rows * 20, seed=4)
+    engine.attach_encoder(ObservationEncoder(gp))
+    rng = random.Random(4)
+    game_overs = 0
+    for _ in range(3000):
+        # head for the food most of the time so the snake grows long
+        # enough to run into itself
+        if engine.food and rng.random() < 0.7:
+            dx, dy = engine.food.x - engine.head.x, engine.food.y - engine.head.y
+            direction = (Direction.RIGHT if dx > 0 else Direction.LEFT) if dx else \
+                (Direction.DOWN if dy > 0 else Direction.UP)
+        else:
+            direction = rng.choice(list(Direction))
+        game_over, _ = engine.step(direction)
+        out = engine.encoder.encode(engine.food, engine.direction)
+        ref = gp.get_normalized_input(list(engine.snake), engine.food, engine.direction)
+        np.testing.assert_array_equal(out["snake_grid"], ref["snake_grid"])
+        np.testing.assert_array_equal(out["food_grid"], ref["food_grid"])
+        if game_over:
+            game_overs += 1
+            engine.reset()
+    assert game_overs > 0
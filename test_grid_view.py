@@ -0,0 +1,32 @@
+import os
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import numpy as np
+import pytest
+import pygame
+from config import BoardConfig
+
+
+def has_color(region, color):
+    return bool((region == color).all(axis=-1).any())
+
+
+@pytest.mark.parametrize("cells", [25, 60, 100, 500])
+def test_start_state_shows_head_and_food(cells):
+    # cell sizes 10, 4, 2 and 1 in the default 250 px view
+    config = BoardConfig.from_cells(cells)
+    engine = config.engine(seed=0)
+    obs = config.grid_processor().get_normalized_input(engine.snake, engine.food, engine.direction)
+    view = config.grid_view()
+    view.update(obs["snake_grid"], obs["food_grid"])
+
+    size = view.grid_pixels
+    pixels = pygame.surfarray.pixels3d(view.surface)
+    snake = pixels[:size, 20:20 + size]
+    food = pixels[:size, size + 40:2 * size + 40]
+    assert has_color(snake, view.snake_colors[0])
+    assert has_color(food, view.food_color)
+
+    # the head fills the centre cell of the view, next to its corner
+    corner = (config.view_size // 2) * view.cell_size + min(1, view.cell_size - 1)
+    assert tuple(snake[corner, corner]) == view.snake_colors[0]
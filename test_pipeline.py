@@ -0,0 +1,37 @@
+import gc
+import numpy as np
+import pytest
+from config import BoardConfig
+from pipeline import TrainingPipeline, LiveSource, encode_states
+
+
+@pytest.mark.parametrize("policy", ["random", "planner"])
+def test_live_batches_on_a_bigger_board(policy):
+    # policies are built for the source's board, not the default 25x25
+    config = BoardConfig.from_cells(40, view_radius=6)
+    source = LiveSource(games=4, policy=policy, config=config)
+    with TrainingPipeline(source, batch_size=32, workers=1, config=config, tensors=False) as pipeline:
+        batch = next(iter(pipeline))
+        assert batch["obs"].shape == (32, 2, 13, 13)
+        assert set(batch["actions"].tolist()) <= {1, 2, 3, 4}
+
+
+def test_process_batches_match_inline_and_outlive_close():
+    source = LiveSource(games=8)
+    kept = []
+    with TrainingPipeline(source, batch_size=64, workers=1, processes=True, tensors=False) as pipeline:
+        for i, batch in enumerate(pipeline):
+            kept.append((batch["obs"], batch["actions"].copy(), batch["obs"].copy()))
+            if i == 2:
+                break
+    # the last batch was still in use when the pipeline closed
+    gc.collect()
+    np.testing.assert_array_equal(kept[-1][0], kept[-1][2])
+
+    grid_processor = BoardConfig().grid_processor()
+    out = np.empty((64, 2, 25, 25), dtype=np.float32)
+    batches = source.batches(64)
+    for _, actions, obs in kept:
+        states, moves = next(batches)
+        np.testing.assert_array_equal(encode_states(states, grid_processor, out), obs)
+        np.testing.assert_array_equal(moves, actions)
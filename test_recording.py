@@ -0,0 +1,76 @@
+import random
+import numpy as np
+import pytest
+from snake_engine import Direction
+from recording import EpisodeRecorder, RecordingWriter, ReplayDataset, pack_actions, unpack_actions
+
+
+def record(path, grid_size, episodes=30, seed=0, max_steps=400):
+    # random games, the last one cut off before it ends; returns every
+    # state (snake, food, direction) the engine went through, per episode
+    rng = random.Random(seed)
+    recorder = EpisodeRecorder(w=grid_size * 20, h=grid_size * 20)
+    played = []
+    with RecordingWriter(path) as writer:
+        for e in range(episodes):
+            recorder.reset(seed=seed + e)
+            engine = recorder.engine
+            states = [(list(engine.snake), engine.food, engine.direction)]
+            limit = 20 if e == episodes - 1 else max_steps
+            for _ in range(limit):
+                action = rng.choice(list(Direction)) if rng.random() < 0.3 else None
+                game_over, _ = recorder.step(action)
+                if game_over:
+                    break
+                states.append((list(engine.snake), engine.food, engine.direction))
+            writer.write(recorder)
+            played.append((states, recorder.game_over, list(engine.snake), engine.food, engine.direction))
+    return played
+
+
+def test_pack_actions_round_trip():
+    codes = np.random.default_rng(0).integers(0, 4, size=37)
+    packed = pack_actions(codes)
+    assert len(packed) == 10
+    np.testing.assert_array_equal(unpack_actions(packed, len(codes)), codes)
+
+
+@pytest.mark.parametrize("grid_size", [7, 25])
+def test_dataset_states_and_replay_match_the_recorded_games(tmp_path, grid_size):
+    path = str(tmp_path / "games.rec")
+    played = record(path, grid_size)
+    dataset = ReplayDataset(path, cache_size=4)
+    assert dataset.num_episodes == len(played)
+    assert len(dataset) == sum(len(states) for states, *_ in played)
+
+    index = 0
+    for number, (states, game_over, snake, food, direction) in enumerate(played):
+        episode = dataset.episode(number)
+        assert episode.game_over == game_over
+        assert episode.num_states == len(states)
+        for t, state in enumerate(states):
+            assert dataset.locate(index) == (number, t)
+            assert dataset.state(index) == state
+            index += 1
+
+        # the engine rebuilt from the recording ends where the game ended,
+        # and can be stopped at any step on the way
+        replayed = episode.replay()
+        assert (list(replayed.snake), replayed.food, replayed.direction) == (snake, food, direction)
+        t = len(states) // 2
+        replayed = episode.replay(t)
+        assert (list(replayed.snake), replayed.food, replayed.direction) == states[t]
+
+
+def test_encode_matches_scalar_observations(tmp_path):
+    from grid_processor import GridProcessor
+    path = str(tmp_path / "games.rec")
+    record(path, 7, episodes=5)
+    dataset = ReplayDataset(path)
+    gp = GridProcessor(7)
+    states = dataset.sample(64, rng=0)
+    batch = dataset.encode(states, gp)
+    for b, state in enumerate(states):
+        ref = gp.get_normalized_input(*state)
+        np.testing.assert_array_equal(batch["snake_grid"][b], ref["snake_grid"])
+        np.testing.assert_array_equal(batch["food_grid"][b], ref["food_grid"])
@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+from batch_env import BatchSnakeEnv
+from replay_buffer import SumTree, PrioritizedReplayBuffer
+
+
+@pytest.mark.parametrize("capacity", [5, 1000, 3000])
+def test_sum_tree_matches_cumulative_sums(capacity):
+    # capacities below and above the levels find() jumps at once
+    rng = np.random.default_rng(capacity)
+    priorities = rng.random(capacity)
+    priorities[rng.random(capacity) < 0.2] = 0
+    tree = SumTree(capacity)
+    tree.update(np.arange(capacity), priorities)
+    for _ in range(5):
+        # repeated indices in one update: the last value is the leaf's
+        indices = rng.integers(0, capacity, size=64)
+        values = rng.random(64) * 3
+        tree.update(indices, values)
+        kept = {i: v for i, v in zip(indices.tolist(), values.tolist())}
+        priorities[list(kept)] = list(kept.values())
+
+        prefix = np.cumsum(priorities)
+        assert tree.total == pytest.approx(prefix[-1])
+        np.testing.assert_array_equal(tree.get(np.arange(capacity)), priorities)
+        draws = rng.random(512) * prefix[-1]
+        expected = np.searchsorted(prefix, draws, side='right')
+        found = tree.find(draws)
+        # a draw within round-off of an interval edge may land either side
+        near = np.abs(prefix[np.minimum(expected, capacity - 1)] - draws) < 1e-9
+        np.testing.assert_array_equal(found[~near], expected[~near])
+        assert (priorities[found] > 0).all()
+
+
+def fill(capacity, num_envs, steps, seed=0):
+    # a buffer fed by a BatchSnakeEnv, and what was written to every row last
+    env = BatchSnakeEnv(num_envs, 7 * 20, 7 * 20, seed=seed)
+    buffer = PrioritizedReplayBuffer(capacity, num_envs, grid_size=7, seed=seed)
+    rng = np.random.default_rng(seed)
+    rows = {}
+    obs = env.reset()
+    buffer.add_initial(obs)
+    rows[0] = (obs.copy(), None, None, None)
+    for step in range(1, steps + 1):
+        actions = rng.integers(0, 5, size=num_envs)
+        obs, rewards, dones = env.step(actions)
+        buffer.add(obs, actions, rewards, dones)
+        rows[step % buffer.rows] = (obs.copy(), actions, rewards.copy(), dones.copy())
+    return buffer, rows
+
+
+@pytest.mark.parametrize("steps", [10, 60])
+def test_samples_rebuild_the_stored_transitions(steps):
+    # 60 steps go round the 20-row ring three times
+    buffer, rows = fill(80, 4, steps)
+    assert len(buffer) == min(steps, buffer.rows - 1) * 4
+    newest = steps % buffer.rows
+    for _ in range(5):
+        batch = buffer.sample(64)
+        light = buffer.sample(64, dense=False)
+        for b, index in enumerate(batch["indices"]):
+            row, column = divmod(int(index), buffer.num_envs)
+            # the oldest row only starts a transition, it never ends one
+            assert row != (newest + 1) % buffer.rows
+            obs, actions, rewards, dones = rows[row]
+            np.testing.assert_array_equal(batch["next_obs"][b], obs[column])
+            np.testing.assert_array_equal(batch["obs"][b], rows[(row - 1) % buffer.rows][0][column])
+            assert batch["actions"][b] == actions[column]
+            assert batch["rewards"][b] == rewards[column]
+            assert batch["dones"][b] == dones[column]
+        g = buffer.grid_size
+        snake = buffer.snake.reshape(-1, g, g)
+        for b, index in enumerate(light["indices"]):
+            row, column = divmod(int(index), buffer.num_envs)
+            assert light["next_obs_index"][b] == index
+            np.testing.assert_array_equal(snake[light["next_obs_index"][b]], rows[row][0][column, 0])
+            np.testing.assert_array_equal(snake[light["obs_index"][b]], rows[(row - 1) % buffer.rows][0][column, 0])
+
+
+def test_priorities_steer_sampling():
+    buffer, _ = fill(400, 4, 50)
+    favourite = int(buffer.sample(1)["indices"][0])
+    buffer.update_priorities(np.arange(len(buffer)) + buffer.num_envs, np.zeros(len(buffer)))
+    buffer.update_priorities([favourite], [1000.0])
+    batch = buffer.sample(256)
+    assert (batch["indices"] == favourite).mean() > 0.9
+    assert batch["weights"].max() == pytest.approx(1.0)